@@ -1,5 +1,12 @@
+import json
 import nbformat
 import random
+import textwrap
+
+from itertools import chain
+
+
+TRY_EXCEPT_TEMPLATE = "try:\n{}\nexcept:\n    pass"
 
 if __name__ == '__main__':
     nb = nbformat.v4.new_notebook()
@@ -14,21 +21,25 @@ if __name__ == '__main__':
             src_cells.append(cell)
 
 
-    # Insert random cells
-    jumbled_cells = []
-    for i in range(1000 - len(src_cells)):
-        cellnum = random.randint(1, len(src_cells) - 1)
-        cell = src_cells[cellnum]
-        # wrap in try except
-        new_cell_code = "try:\n"
-        for line in cell.source.split("\n"):
-            new_cell_code += "    " + line + "\n"
-        new_cell_code += "except:\n"
-        new_cell_code += "    pass"
-        new_cell = nbformat.v4.new_code_cell(source=new_cell_code)
-        jumbled_cells.append(new_cell)
+    # Wrap each source cell in try except once; jumbled cells reuse these.
+    wrapped_sources = [TRY_EXCEPT_TEMPLATE.format(textwrap.indent(cell.source, "    ")) for cell in src_cells]
 
-    nb["cells"] = src_cells + jumbled_cells
+    # Insert random cells. Generated lazily so that only one jumbled cell is alive at a time.
+    jumbled_cells = (
+        nbformat.v4.new_code_cell(source=wrapped_sources[cellnum])
+        for cellnum in random.choices(range(1, len(src_cells)), k=1000 - len(src_cells))
+    )
 
+    # The cells are freshly built from the v4 schema, so skip nbformat's validation pass and stream
+    # the notebook to disk one cell at a time instead of materializing the full cell list.
+    nb_header = {key: value for key, value in nb.items() if key != "cells"}
     with open("tests/notebooks/Qiskit_jumbled.ipynb", mode="w", encoding="utf-8") as f:
-        nbformat.write(nb, f)
+        f.write('{"cells": [')
+        for idx, cell in enumerate(chain(src_cells, jumbled_cells)):
+            if idx > 0:
+                f.write(",")
+            f.write("\n")
+            json.dump(cell, f, indent=1, sort_keys=True, ensure_ascii=False)
+        f.write("\n], ")
+        f.write(json.dumps(nb_header, indent=1, sort_keys=True, ensure_ascii=False)[1:])
+        f.write("\n")
@@ -4,11 +4,23 @@ __version__ = "0.2.0"
 # This allows `%load_ext kishu` in Jupyter.
 # Then, `%lsmagic` includes kishu functions.
 # kishu can be enabled with `%kishu enable` to enable automatic tracing.
-from .jupyterint import init_kishu, detach_kishu
+#
+# Jupyter integration pulls in the planner and its heavy dependencies, so it is only imported on
+# first access (e.g., `from kishu import init_kishu`) rather than on every `import kishu.*`.
+_JUPYTERINT_EXPORTS = {'init_kishu', 'detach_kishu', 'wait_for_idle'}
+
+
+def __getattr__(name):
+    if name in _JUPYTERINT_EXPORTS:
+        from . import jupyterint
+        return getattr(jupyterint, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     '__app_name__',
     '__version__',
     'init_kishu',
     'detach_kishu',
+    'wait_for_idle',
 ]
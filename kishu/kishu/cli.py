@@ -1,36 +1,37 @@
 from __future__ import annotations
 
-import shutil
-import subprocess
+import sys
 import typer
 
 
 from abc import ABC, abstractmethod
-from functools import wraps
-from typing import List, Tuple
+from functools import lru_cache, wraps
+from itertools import chain
+from operator import attrgetter
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 from kishu import __app_name__, __version__
-from kishu.commands import (
-    CheckoutResult,
-    CommitResult,
-    CommitSummary,
-    DetachResult,
-    InitResult,
-    InstrumentResult,
-    InstrumentStatus,
-    into_json,
-    KishuCommand,
-    LogAllResult,
-    LogResult,
-)
-from kishu.notebook_id import NotebookId
 from kishu.storage.config import Config
 
+# Commands pull in the whole Jupyter integration and planner (slow to import), so they are
+# imported inside each command to keep `kishu --version` and `kishu --help` fast.
+if TYPE_CHECKING:
+    from kishu.commands import (
+        CheckoutResult,
+        CommitResult,
+        CommitSummary,
+        DetachResult,
+        InitResult,
+        InstrumentResult,
+        LogAllResult,
+        LogResult,
+    )
+
 
 class CommitPrinter(ABC):
-    def __init__(self, indentation: str = "    "):
+    def __init__(self, output: List[str], indentation: str = "    "):
         self.indentation = indentation
-        self.output: List[str] = []
+        self.output = output
 
     def add_line(self, text: str, is_indented: bool = False, prefix: str = ""):
         indent = self.indentation if is_indented else ''
@@ -69,63 +70,99 @@ class GraphCommitPrinter(CommitPrinter):
 
 class KishuPrint:
     @staticmethod
+    @lru_cache(maxsize=1)
     def _get_terminal_height():
+        import shutil
         return shutil.get_terminal_size().lines     # fallback (80, 24)
 
     @staticmethod
-    def _print_or_page(output):
-        lines = len(output.splitlines())
-        if lines > min(80, KishuPrint._get_terminal_height()):
-            p = subprocess.Popen(
-                ['less', '-R'],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE
-            )
+    def _print_or_page(output: str, num_lines: Optional[int] = None):
+        if num_lines is None:
+            num_lines = output.count("\n") + 1
+        if num_lines > min(80, KishuPrint._get_terminal_height()):
+            import subprocess
+            p = subprocess.Popen(['less', '-R'], stdin=subprocess.PIPE)
             p.communicate(input=output.encode('utf-8'))
         else:
             print(output)
 
+    @staticmethod
+    def _print_or_page_commits(
+        sorted_commits: List[CommitSummary],
+        include_parent_id: bool = False,
+        graph: bool = False,
+    ):
+        """
+        Prints commits, or streams them commit by commit into a pager if they overflow the terminal.
+        """
+        max_lines = min(80, KishuPrint._get_terminal_height())
+        commit_iter = iter(sorted_commits)
+        output: List[str] = []
+        for commit in commit_iter:
+            KishuPrint._format_commit(commit, output, include_parent_id=include_parent_id, graph=graph)
+            if len(output) > max_lines:
+                break
+        else:
+            KishuPrint._print_or_page('\n'.join(output), num_lines=len(output))
+            return
+
+        # Stdout is inherited so less writes to the terminal while we keep feeding its stdin.
+        import subprocess
+        p = subprocess.Popen(['less', '-R'], stdin=subprocess.PIPE, bufsize=64 * 1024)
+        assert p.stdin is not None
+        try:
+            p.stdin.write('\n'.join(output).encode('utf-8'))
+            for commit in commit_iter:
+                output = []
+                KishuPrint._format_commit(commit, output, include_parent_id=include_parent_id, graph=graph)
+                p.stdin.write(b'\n')
+                p.stdin.write('\n'.join(output).encode('utf-8'))
+            p.stdin.close()
+        except BrokenPipeError:
+            # User quit the pager before reading everything.
+            pass
+        p.wait()
+
     @staticmethod
     def log(log_result: LogResult, graph: bool = False):
         # Sort by timestamp in descending order
         sorted_commits = sorted(
             log_result.commit_graph,
-            key=lambda commit: commit.timestamp, reverse=True,
+            key=attrgetter("timestamp"), reverse=True,
         )
 
-        output = [
-            KishuPrint._format_commit(commit, graph=graph)
-            for commit in sorted_commits
-        ]
-        KishuPrint._print_or_page('\n'.join(output))
+        KishuPrint._print_or_page_commits(sorted_commits, graph=graph)
 
     @staticmethod
     def log_all(log_all_result: LogAllResult):
         # Sort by timestamp in descending order
         sorted_commits = sorted(
             log_all_result.commit_graph,
-            key=lambda commit: commit.timestamp, reverse=True,
+            key=attrgetter("timestamp"), reverse=True,
         )
 
-        output = [
-            KishuPrint._format_commit(commit, include_parent_id=True)
-            for commit in sorted_commits
-        ]
-        KishuPrint._print_or_page('\n'.join(output))
+        KishuPrint._print_or_page_commits(sorted_commits, include_parent_id=True)
 
     @staticmethod
     def log_all_with_graph(log_all_result: LogAllResult):
-        KishuPrint._print_or_page("Warning: feature not supported. Non-graph option will be displayed instead.")
+        KishuPrint._print_or_page(
+            "Warning: feature not supported. Non-graph option will be displayed instead.",
+            num_lines=1,
+        )
         KishuPrint.log_all(log_all_result)
 
     @staticmethod
     def _format_commit(
         commit: CommitSummary,
+        output: List[str],
         include_parent_id: bool = False,
         graph: bool = False
-    ):
-        printer = BasicCommitPrinter() if not graph else GraphCommitPrinter()
-        ref_names = ', '.join(commit.branches + commit.tags)
+    ) -> None:
+        """
+        Appends the formatted lines of a commit to output.
+        """
+        printer = BasicCommitPrinter(output) if not graph else GraphCommitPrinter(output)
+        ref_names = ', '.join(chain(commit.branches, commit.tags))
         ref_str = f" ({ref_names})" if ref_names else ""
         printer.add_commit_line(f"commit {commit.commit_id}{ref_str}",
                                 is_first_line=True)
@@ -140,8 +177,6 @@ class KishuPrint:
         printer.add_commit_line(commit.message, is_indented=True)
         printer.add_commit_line("")
 
-        return '\n'.join(printer.output)
-
 
 kishu_app = typer.Typer(add_completion=False)
 
@@ -152,10 +187,15 @@ def _version_callback(value: bool) -> None:
         raise typer.Exit()
 
 
+@lru_cache(maxsize=1)
+def _is_verbose() -> bool:
+    return Config.get('CLI', 'KISHU_VERBOSE', True)
+
+
 def print_clean_errors(fn):
     @wraps(fn)
     def fn_with_clean_errors(*args, **kwargs):
-        if Config.get('CLI', 'KISHU_VERBOSE', True):
+        if _is_verbose():
             return fn(*args, **kwargs)
         try:
             return fn(*args, **kwargs)
@@ -164,10 +204,17 @@ def print_clean_errors(fn):
     return fn_with_clean_errors
 
 
+@lru_cache(maxsize=128)
+def _parse_notebook_key(notebook_path_or_key: str) -> str:
+    from kishu.notebook_id import NotebookId
+    return NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+
+
 def print_reattachment_message(response: InstrumentResult):
     """
     Prints reattachment message, returns whether or not to print the actual response message
     """
+    from kishu.commands import InstrumentStatus
     if response.status == InstrumentStatus.already_attached:
         return True
     if response.status in [InstrumentStatus.reattach_succeeded, InstrumentStatus.reattach_init_fail]:
@@ -185,7 +232,7 @@ def print_reattachment_message(response: InstrumentResult):
 def print_init_message(response: InitResult) -> None:
     nb_id = response.notebook_id
     if response.status != "ok":
-        error = response.message.split(": ")[0]
+        error = response.message.partition(": ")[0]
         if error == "FileNotFoundError":
             print("Notebook kernel not found. Make sure Jupyter kernel is running for requested notebook")
         else:
@@ -202,7 +249,7 @@ def print_init_message(response: InitResult) -> None:
 
 def print_detach_message(response: DetachResult, notebook_path: str) -> None:
     if response.status != "ok":
-        error = response.message.split(": ")[0]
+        error = response.message.partition(": ")[0]
         if error == "FileNotFoundError":
             print("Notebook kernel not found. Make sure Jupyter kernel is running for requested notebook")
         else:
@@ -258,6 +305,7 @@ def list(
     """
     List existing Kishu sessions.
     """
+    from kishu.commands import into_json, KishuCommand
     print(into_json(KishuCommand.list(list_all=list_all)))
 
 
@@ -273,6 +321,7 @@ def init(
     """
     Initialize Kishu instrumentation in a notebook.
     """
+    from kishu.commands import KishuCommand
     print_init_message(KishuCommand.init(notebook_path))
 
 
@@ -288,6 +337,7 @@ def detach(
     """
     Detach Kishu instrumentation from notebook
     """
+    from kishu.commands import KishuCommand
     print_detach_message(KishuCommand.detach(notebook_path), notebook_path)
 
 
@@ -318,7 +368,8 @@ def log(
     """
     Show a history view of commit graph.
     """
-    notebook_key = NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+    from kishu.commands import KishuCommand
+    notebook_key = _parse_notebook_key(notebook_path_or_key)
     if log_all:
         log_all_result = KishuCommand.log_all(notebook_key)
         if graph:
@@ -342,7 +393,8 @@ def status(
     """
     Show a commit in detail.
     """
-    notebook_key = NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+    from kishu.commands import into_json, KishuCommand
+    notebook_key = _parse_notebook_key(notebook_path_or_key)
     print(into_json(KishuCommand.status(notebook_key, commit_id)))
 
 
@@ -375,6 +427,7 @@ def commit(
     """
     Create or edit a Kishu commit.
     """
+    from kishu.commands import into_json, KishuCommand
     if edit_branch_or_commit_id:
         print(into_json(KishuCommand.edit_commit(
             notebook_path_or_key,
@@ -408,6 +461,7 @@ def checkout(
     """
     Checkout a notebook to a commit.
     """
+    from kishu.commands import KishuCommand
     print_checkout_message(KishuCommand.checkout(
         notebook_path_or_key,
         branch_or_commit_id,
@@ -455,7 +509,8 @@ def branch(
     """
     Create, rename, or delete branches.
     """
-    notebook_key = NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+    from kishu.commands import into_json, KishuCommand
+    notebook_key = _parse_notebook_key(notebook_path_or_key)
     if create_branch_name is not None:
         print(into_json(KishuCommand.branch(notebook_key, create_branch_name, commit_id)))
     if delete_branch_name is not None:
@@ -508,7 +563,8 @@ def tag(
     """
     Create or edit tags.
     """
-    notebook_key = NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+    from kishu.commands import into_json, KishuCommand
+    notebook_key = _parse_notebook_key(notebook_path_or_key)
     if list_tag:
         print(into_json(KishuCommand.list_tag(notebook_key)))
     if tag_name is not None:
@@ -536,7 +592,8 @@ def fegraph(
     """
     Show the frontend commit graph.
     """
-    notebook_key = NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+    from kishu.commands import into_json, KishuCommand
+    notebook_key = _parse_notebook_key(notebook_path_or_key)
     print(into_json(KishuCommand.fe_commit_graph(notebook_key)))
 
 
@@ -557,15 +614,20 @@ def fecommit(
     """
     Show the commit in frontend detail.
     """
-    notebook_key = NotebookId.parse_key_from_path_or_key(notebook_path_or_key)
+    from kishu.commands import into_json, KishuCommand
+    notebook_key = _parse_notebook_key(notebook_path_or_key)
     print(into_json(KishuCommand.fe_commit(notebook_key, commit_id, vardepth)))
 
 
-if Config.get('CLI', 'KISHU_ENABLE_EXPERIMENTAL', False):
-    kishu_app.add_typer(kishu_experimental_app, name="experimental")
+def _add_experimental_app() -> None:
+    if Config.get('CLI', 'KISHU_ENABLE_EXPERIMENTAL', False):
+        kishu_app.add_typer(kishu_experimental_app, name="experimental")
 
 
 def main() -> None:
+    # Version queries exit in the eager callback, so they skip reading the config file.
+    if not {"--version", "-v"} & set(sys.argv[1:]):
+        _add_experimental_app()
     kishu_app(prog_name=__app_name__)
 
 
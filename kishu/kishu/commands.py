@@ -4,7 +4,7 @@ import datetime
 import enum
 import json
 
-from dataclasses import asdict, dataclass, is_dataclass
+from dataclasses import asdict, dataclass, is_dataclass, replace
 from dataclasses_json import dataclass_json
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -389,7 +389,10 @@ class KishuCommand:
             KishuCommitGraph.new_on_file(KishuPath.commit_graph_directory(notebook_id))
                             .iter_history(commit_id)
         )
-        commit_entry = KishuCommit(notebook_id).get_commit(commit_id)
+        kishu_commit = KishuCommit(notebook_id)
+        commit_entry = kishu_commit.get_commit(commit_id)
+        # Stored entries only hold the cells executed since their base commit.
+        commit_entry = replace(commit_entry, executed_cells=kishu_commit.get_executed_cells(commit_entry))
         return StatusResult(
             commit_node_info=commit_node_info,
             commit_entry=commit_entry
@@ -793,7 +796,7 @@ class KishuCommand:
         ]
 
         # Compile list of executed cells.
-        executed_cells = [] if commit_entry.executed_cells is None else commit_entry.executed_cells
+        executed_cells = KishuCommit(notebook_id).get_executed_cells(commit_entry) or []
 
         # Compile list of cells.
         cells: List[FESelectedCommitCell] = []
@@ -947,11 +950,12 @@ class KishuCommand:
 
     @staticmethod
     def _retrieve_all_cells(notebook_id: str, commit_id: str):
-        commit_entry = KishuCommit(notebook_id).get_commit(commit_id)
+        kishu_commit = KishuCommit(notebook_id)
+        commit_entry = kishu_commit.get_commit(commit_id)
         formatted_cells = commit_entry.formatted_cells
         if formatted_cells is None:
             raise NoFormattedCellsError(commit_id)
-        executed_cells = commit_entry.executed_cells
+        executed_cells = kishu_commit.get_executed_cells(commit_entry)
         if executed_cells is None:
             raise NoExecutedCellsError(commit_id)
         cells = KishuCommand._get_cells_as_strings(formatted_cells)
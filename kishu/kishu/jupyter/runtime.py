@@ -127,6 +127,25 @@ class JupyterRuntimeEnv:
         with open(notebook_path, 'r') as f:
             return nbformat.read(f, JupyterRuntimeEnv.NBFORMAT_VERSION)
 
+    @staticmethod
+    def read_notebook_json(notebook_path: Path) -> nbformat.NotebookNode:
+        """
+        Reads a notebook as stored on disk, skipping nbformat's version conversion and schema
+        validation. Multi-line strings stay split into lists of lines.
+        """
+        with open(notebook_path, 'rb') as f:
+            return nbformat.from_dict(json.loads(f.read()))
+
+    @staticmethod
+    def write_notebook_json(nb: nbformat.NotebookNode, notebook_path: Path) -> None:
+        """
+        Writes a notebook read by read_notebook_json in nbformat's on-disk layout, skipping schema
+        validation.
+        """
+        nb_json = json.dumps(nb, indent=1, sort_keys=True, separators=(",", ": "), ensure_ascii=False)
+        with open(notebook_path, 'w', encoding="utf8") as f:
+            f.write(nb_json + "\n")
+
     @staticmethod
     def read_notebook_cell_source(notebook_path: Path) -> List[str]:
         nb = JupyterRuntimeEnv.read_notebook(notebook_path)
@@ -41,7 +41,6 @@ Reference
 from __future__ import annotations
 
 import contextlib
-import dill as pickle
 import IPython
 import io
 import ipylab
@@ -49,19 +48,24 @@ import json
 import jupyter_client
 import nbformat
 import os
+import sqlite3
 import time
 import uuid
 import sys
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from IPython.core.interactiveshell import InteractiveShell
 from jupyter_ui_poll import run_ui_poll_loop
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Generator, List, Mapping, Optional, Tuple
 
 from kishu.exceptions import (
     JupyterConnectionError,
     KernelNotAliveError,
+    MissingCommitEntryError,
     MissingConnectionInfoError,
     MissingNotebookMetadataError,
     NoChannelError,
@@ -77,7 +81,7 @@ from kishu.planning.planner import CheckpointRestorePlanner, ChangedVariables
 from kishu.planning.variable_version_tracker import VariableVersionTracker
 from kishu.storage.branch import KishuBranch
 from kishu.storage.checkpoint import KishuCheckpoint
-from kishu.storage.commit import CommitEntry, CommitEntryKind, FormattedCell, KishuCommit
+from kishu.storage.commit import CommitEntry, CommitEntryKind, FormattedCell, KishuCommit, LazyCommitEntry
 from kishu.storage.commit_graph import KishuCommitGraph
 from kishu.storage.config import Config
 from kishu.storage.path import KishuPath
@@ -89,7 +93,20 @@ Functions to find enclosing notebook name, distilled From ipynbname.
 """
 
 
+# The frontend does not change within a kernel process, so it is only detected once.
+_PLATFORM_CACHE: Optional[str] = None
+
+
 def enclosing_platform() -> str:
+    global _PLATFORM_CACHE
+    if os.environ.get(KishuForJupyter.ENV_KISHU_TEST_MODE, False):
+        return "jupyternb"
+    if _PLATFORM_CACHE is None:
+        _PLATFORM_CACHE = _detect_platform()
+    return _PLATFORM_CACHE
+
+
+def _detect_platform() -> str:
     app = ipylab.JupyterFrontEnd()
     num_trials = 10
 
@@ -252,6 +269,9 @@ class KishuForJupyter:
     # RELOAD_CMD = "try { IPython.notebook.load_notebook(IPython.notebook.notebook_path); } catch { }"
     RELOAD_CMD = "try { location.reload(true); } catch { }"  # will ask confirmation
     ENV_KISHU_TEST_MODE = "ENV_KISHU_TEST_MODE"
+    SAVE_TIMEOUT_S = 5.0
+    SESSION_STATE_CACHE_SIZE = 64
+    EXECUTED_CELLS_SNAPSHOT_INTERVAL = 32
 
     def __init__(
         self,
@@ -282,9 +302,22 @@ class KishuForJupyter:
         # Stateful trackers.
         self._cr_planner = CheckpointRestorePlanner.from_existing(self._user_ns)
         self._variable_version_tracker = VariableVersionTracker({})
+        self._last_variable_version_commit_id: Optional[str] = None
+        self._executed_cells_commit_id: Optional[str] = None
+        self._executed_cells_end = 0
+        self._executed_cells_depth = 0
+        self._session_state_cache: OrderedDict[str, str] = OrderedDict()
+        self._active_versions_cache: OrderedDict[str, Mapping[FrozenSet[str], int]] = OrderedDict()
         self._start_time: Optional[float] = None
         self._last_execution_count = 0
 
+        # Parsed notebook cache, valid while the notebook file's mtime is unchanged.
+        self._nb_cache_mtime: Optional[int] = None
+        self._nb_cache_raw: Optional[str] = None
+        self._nb_cache_formatted: List[FormattedCell] = []
+        self._nb_cache_code_version: int = 0
+        self._nb_cache_cell_hashes: Dict[int, Tuple[str, str, int]] = {}
+
         # Configurations.
         self._test_mode = Config.get('JUPYTERINT', 'test_mode', False)
         self._commit_id_mode = Config.get('JUPYTERINT', 'commit_id_mode', 'uuid4')
@@ -294,6 +327,13 @@ class KishuForJupyter:
             'enable_auto_commit_when_skip_notebook',
             True)
 
+        # Optionally write automatic commits on a worker thread so that a cell completes without
+        # waiting for its checkpoint. The next cell or Kishu command waits for the pending commit.
+        self._commit_executor: Optional[ThreadPoolExecutor] = None
+        if Config.get('JUPYTERINT', 'background_commit', False):
+            self._commit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kishu-commit")
+        self._pending_commit: Optional[Future] = None
+
         # Initialize databases.
         self._kishu_commit.init_database()
         self._kishu_checkpoint.init_database()
@@ -308,6 +348,10 @@ class KishuForJupyter:
             self._commit_id_mode = "counter"
         self.total_commit_size = 0
 
+        # Running total of the notebook directory size, seeded by a directory walk on first use.
+        self._checkpoint_bytes_on_disk: Optional[int] = None
+        self._num_checkpoint_size_records = 0
+
     def __str__(self):
         return (
             "KishuForJupyter("
@@ -341,6 +385,7 @@ class KishuForJupyter:
         """
         Removes event handlers added by load_kishu
         """
+        self.wait_for_idle()
         try:
             self._ip.events.unregister('post_run_cell', self.post_run_cell)
         except ValueError:
@@ -357,8 +402,7 @@ class KishuForJupyter:
         nb_path = self._notebook_id.path()
 
         # Remember starting state.
-        start_mtime = os.path.getmtime(nb_path)
-        current_mtime = start_mtime
+        start_mtime = os.stat(nb_path).st_mtime_ns
 
         # Issue save command.
         if self._platform == "jupyterlab":
@@ -368,15 +412,16 @@ class KishuForJupyter:
             # In Jupyter Notebook.
             IPython.display.display(IPython.display.Javascript(KishuForJupyter.SAVE_CMD))
 
-        # Now wait for the saving to change the notebook.
-        sleep_t = 0.2
-        time.sleep(sleep_t)
-        while start_mtime == current_mtime and sleep_t < 1.0:
-            current_mtime = os.path.getmtime(nb_path)
-            sleep_t *= 1.2
+        # Now wait for the saving to change the notebook. Poll at short, growing intervals so that
+        # a fast save is noticed within milliseconds rather than after a fixed delay.
+        deadline = time.monotonic() + KishuForJupyter.SAVE_TIMEOUT_S
+        sleep_t = 0.005
+        while os.stat(nb_path).st_mtime_ns == start_mtime:
+            if time.monotonic() >= deadline:
+                print("WARNING: Notebook saving is taking too long. Kishu may not capture every cell.")
+                return
             time.sleep(sleep_t)
-        if sleep_t >= 1.0:
-            print("WARNING: Notebook saving is taking too long. Kishu may not capture every cell.")
+            sleep_t = min(sleep_t * 1.5, 0.1)
 
     def reload_jupyter_frontend(self):
         if self._test_mode:  # TODO: enable after unit test jupyter has frontend component.
@@ -392,6 +437,7 @@ class KishuForJupyter:
         """
         Restores a variable state from commit_id.
         """
+        self.wait_for_idle()
         start = time.time()
         commit_id = branch_or_commit_id
         # By default, checkout at commit ID in detach mode.
@@ -412,8 +458,7 @@ class KishuForJupyter:
         database_path = self.database_path()
         commit_id = KishuForJupyter.disambiguate_commit(self._notebook_id.key(), commit_id)
         self._cr_planner.write_row("pre-checkout-time1", time.time() - start)
-        commit_entry_active_vses_string = self._kishu_commit.get_session_state(commit_id)
-        # commit_entry = self._kishu_commit.get_commit(commit_id)
+        commit_entry = self._kishu_commit.get_lazy_commit(commit_id)
         # if commit_entry.restore_plan is None:
         #     raise ValueError("No restore plan found for commit_id = {}".format(commit_id))
 
@@ -427,10 +472,11 @@ class KishuForJupyter:
         #     self._checkout_notebook(commit_entry.raw_nb)
 
         # # Restore list of executed cells.
-        # if commit_entry.executed_cells is not None:
+        # executed_cells = self._kishu_commit.get_executed_cells(commit_entry)
+        # if executed_cells is not None:
         #     current_executed_cells = self._user_ns.ipython_in()
         #     if current_executed_cells is not None:
-        #         current_executed_cells[:] = commit_entry.executed_cells[:]
+        #         current_executed_cells[:] = executed_cells[:]
 
         # # Restore execution count.
         # if commit_entry.execution_count is not None:
@@ -445,29 +491,31 @@ class KishuForJupyter:
 
         # Find the lowest common ancestor of current and target commit.
         current_commit_id = self._kishu_graph.head()
-        if Config.get('PLANNER', 'incremental_cr', False):
+        incremental_cr = Config.get('PLANNER', 'incremental_cr', False)
+        if incremental_cr:
             lca_commit = self._kishu_graph.get_common_ancestor(commit_id, current_commit_id)
             if lca_commit:
-                # lca_commit_entry = self._kishu_commit.get_commit(lca_commit)
+                lca_commit_entry = self._kishu_commit.get_lazy_commit(lca_commit)
                 # #REVISION--
                 # if lca_commit_entry.active_vses_string is None:
                 #     raise ValueError("No Active VSes found for commit_id = {}".format(commit_id))
                 # if lca_commit_entry.ahg_string is None:
                 #     raise ValueError("No Application History Graph found for commit_id = {}".format(commit_id))
                 # REVISION-----
-                #lca_active_vses_string = lca_commit_entry.active_vses_string
-                lca_active_vses_string = self._kishu_commit.get_session_state(lca_commit)
+                self._load_session_states([commit_entry, lca_commit_entry])
+                lca_active_vses_string = lca_commit_entry.active_vses_string
                 # lca_ahg_string = lca_commit_entry.ahg_string
 
                 #REVISION test
-                target_active_vns = set(AHG.deserialize_active_vses(commit_entry_active_vses_string))
-                lca_active_vns = set(AHG.deserialize_active_vses(lca_active_vses_string))
-                my_active_vns = {VersionedName(vs.name, vs.version) for vs in self._cr_planner._ahg.get_active_variable_snapshots()}
-                common_set = set()
-                for vn in target_active_vns:
-                    if vn in lca_active_vns and vn in my_active_vns:
-                        common_set.add(vn)
-                delta_set = target_active_vns.difference(common_set)
+                target_versions = self._active_versions_of_commit(commit_id, commit_entry.active_vses_string)
+                lca_versions = self._active_versions_of_commit(lca_commit, lca_active_vses_string)
+                my_versions = self._cr_planner.get_ahg().get_active_versions()
+                common_names = {
+                    name for name in target_versions.keys() & lca_versions.keys() & my_versions.keys()
+                    if target_versions[name] == lca_versions[name] == my_versions[name]
+                }
+                delta_set = {VersionedName(name, version) for name, version in target_versions.items()
+                             if name not in common_names}
                 parent_commit_ids = [node.commit_id for node in self._kishu_graph.list_history(commit_id)]
             else:
                 #REVISION-----
@@ -483,8 +531,8 @@ class KishuForJupyter:
         #     commit_entry.restore_plan,
         #     database_path,
         #     commit_id,
-        #     parent_commit_ids if Config.get('PLANNER', 'incremental_cr', False) else None,
-        #     lca_active_vses_string if Config.get('PLANNER', 'incremental_cr', False) else None
+        #     parent_commit_ids if incremental_cr else None,
+        #     lca_active_vses_string if incremental_cr else None
         # )
         # self._checkout_namespace(self._user_ns, result_ns)
 
@@ -520,6 +568,7 @@ class KishuForJupyter:
         print('info.cell_id =', info.cell_id)
         print(dir(info))
         """
+        self.wait_for_idle()
         self._start_time = time.time()
 
         # Saving needs to be before cell execution, otherwise stream/print output will disappear.
@@ -560,62 +609,111 @@ class KishuForJupyter:
         self._last_execution_count += 1
         self._start_time = None
 
-        self._commit_entry(entry, changed_vars)
+        if self._commit_executor is not None:
+            self.wait_for_idle()
+            self._pending_commit = self._commit_executor.submit(self._commit_entry, entry, changed_vars)
+        else:
+            self._commit_entry(entry, changed_vars)
+
+    def wait_for_idle(self) -> None:
+        """
+        Blocks until the pending background commit, if any, is written. Errors raised while writing
+        it are raised here.
+        """
+        pending_commit, self._pending_commit = self._pending_commit, None
+        if pending_commit is not None:
+            pending_commit.result()
+
+    def _load_session_states(self, commit_entries: List[LazyCommitEntry]) -> None:
+        """
+        Fills in the serialized active VSes of each commit entry, fetching uncached ones in one query.
+        Commits are immutable, so these are cached by commit ID.
+        """
+        commit_ids = [commit_entry.commit_id for commit_entry in commit_entries]
+        missing_commit_ids = [commit_id for commit_id in commit_ids if commit_id not in self._session_state_cache]
+        if missing_commit_ids:
+            session_states = self._kishu_commit.get_session_states(missing_commit_ids)
+            for commit_id in missing_commit_ids:
+                if commit_id not in session_states:
+                    raise MissingCommitEntryError(commit_id)
+                self._session_state_cache[commit_id] = session_states[commit_id]
+        for commit_entry in commit_entries:
+            self._session_state_cache.move_to_end(commit_entry.commit_id)
+            commit_entry.active_vses_string = self._session_state_cache[commit_entry.commit_id]
+        while len(self._session_state_cache) > KishuForJupyter.SESSION_STATE_CACHE_SIZE:
+            self._session_state_cache.popitem(last=False)
+
+    def _active_versions_of_commit(self, commit_id: str, active_vses_string: str) -> Mapping[FrozenSet[str], int]:
+        """
+        Returns the active variable versions decoded from a commit's serialized active VSes, cached by
+        commit ID.
+        """
+        if commit_id not in self._active_versions_cache:
+            self._active_versions_cache[commit_id] = MappingProxyType(AHG.deserialize_active_vses(active_vses_string))
+            while len(self._active_versions_cache) > KishuForJupyter.SESSION_STATE_CACHE_SIZE:
+                self._active_versions_cache.popitem(last=False)
+        self._active_versions_cache.move_to_end(commit_id)
+        return self._active_versions_cache[commit_id]
 
     @staticmethod
     def kishu_sessions() -> List[KishuSession]:
         # List alive IPython sessions.
         alive_kernels = {session.kernel_id: session for session in JupyterRuntimeEnv.iter_sessions()}
 
-        # List all Kishu sessions.
-        sessions = []
-        for notebook_key in KishuPath.iter_notebook_keys():
-            cf = NotebookId.try_retrieve_connection(notebook_key)
-
-            # Connection file not found.
-            if cf is None:
-                sessions.append(KishuSession(
-                    notebook_key=notebook_key,
-                    kernel_id=None,
-                    notebook_path=None,
-                    is_alive=False,
-                ))
-                continue
-
-            # No matching alive kernel ID.
-            if cf.kernel_id not in alive_kernels:
-                sessions.append(KishuSession(
-                    notebook_key=notebook_key,
-                    kernel_id=cf.kernel_id,
-                    notebook_path=cf.notebook_path,
-                    is_alive=False,
-                ))
-                continue
+        # List all Kishu sessions. Each notebook only needs file reads, so check them concurrently.
+        notebook_keys = list(KishuPath.iter_notebook_keys())
+        if not notebook_keys:
+            return []
+        with ThreadPoolExecutor(max_workers=min(32, len(notebook_keys))) as executor:
+            return list(executor.map(
+                lambda notebook_key: KishuForJupyter._kishu_session(notebook_key, alive_kernels),
+                notebook_keys,
+            ))
 
-            # No matching notebook with notebook key in its metadata.
-            notebook_path = alive_kernels[cf.kernel_id].notebook_path
-            written_notebook_key: Optional[str] = None
-            try:
-                written_notebook_key = NotebookId.parse_key_from_path(notebook_path)
-            except (FileNotFoundError, MissingNotebookMetadataError):
-                pass
-            if notebook_key != written_notebook_key:
-                sessions.append(KishuSession(
-                    notebook_key=notebook_key,
-                    kernel_id=cf.kernel_id,
-                    notebook_path=cf.notebook_path,
-                    is_alive=False,
-                ))
-                continue
+    @staticmethod
+    def _kishu_session(notebook_key: str, alive_kernels: Dict[str, Any]) -> KishuSession:
+        cf = NotebookId.try_retrieve_connection(notebook_key)
+
+        # Connection file not found.
+        if cf is None:
+            return KishuSession(
+                notebook_key=notebook_key,
+                kernel_id=None,
+                notebook_path=None,
+                is_alive=False,
+            )
 
-            # Kernel ID is alive. Replace notebook path with the newest one.
-            sessions.append(KishuSession(
+        # No matching alive kernel ID.
+        if cf.kernel_id not in alive_kernels:
+            return KishuSession(
                 notebook_key=notebook_key,
                 kernel_id=cf.kernel_id,
-                notebook_path=str(notebook_path),
-                is_alive=True,
-            ))
-        return sessions
+                notebook_path=cf.notebook_path,
+                is_alive=False,
+            )
+
+        # No matching notebook with notebook key in its metadata.
+        notebook_path = alive_kernels[cf.kernel_id].notebook_path
+        written_notebook_key: Optional[str] = None
+        try:
+            written_notebook_key = NotebookId.parse_key_from_path(notebook_path)
+        except (FileNotFoundError, MissingNotebookMetadataError):
+            pass
+        if notebook_key != written_notebook_key:
+            return KishuSession(
+                notebook_key=notebook_key,
+                kernel_id=cf.kernel_id,
+                notebook_path=cf.notebook_path,
+                is_alive=False,
+            )
+
+        # Kernel ID is alive. Replace notebook path with the newest one.
+        return KishuSession(
+            notebook_key=notebook_key,
+            kernel_id=cf.kernel_id,
+            notebook_path=str(notebook_path),
+            is_alive=True,
+        )
 
     @staticmethod
     def disambiguate_commit(notebook_key: str, commit_id: str) -> str:
@@ -633,6 +731,7 @@ class KishuForJupyter:
         entry = CommitEntry(kind=CommitEntryKind.manual)
         entry.execution_count = self._ip.execution_count
         entry.message = message if message is not None else f"Manual commit after {entry.execution_count} executions."
+        self.wait_for_idle()
         self.save_notebook()
         self._commit_entry(entry)
         return BareReprStr(entry.commit_id)
@@ -643,14 +742,8 @@ class KishuForJupyter:
         entry.timestamp = time.time()
 
         # Observe all cells and extract notebook informations.
-        entry.executed_cells = self._user_ns.ipython_in()
-        entry.raw_nb, entry.formatted_cells = self._all_notebook_cells()
-        if entry.formatted_cells is not None:
-            code_cells = []
-            for cell in entry.formatted_cells:
-                code_cells.append(cell.cell_type)
-                code_cells.append(cell.source)
-            entry.code_version = hash(tuple(code_cells))
+        self._set_executed_cells(entry)
+        entry.raw_nb, entry.formatted_cells, entry.code_version = self._all_notebook_cells()
 
         # Plan for checkpointing and restoration.
         checkpoint_start_time = time.time()
@@ -661,26 +754,102 @@ class KishuForJupyter:
         checkpoint_runtime_s = time.time() - checkpoint_start_time
         entry.checkpoint_runtime_s = checkpoint_runtime_s
 
-        # Update other structures.
-        self.total_commit_size += self._kishu_commit.store_commit(entry)
+        # Update other structures, writing all commit metadata in one database transaction.
+        with self._commit_txn() as con:
+            commit_size = self._kishu_commit.store_commit(entry, con=con)
+            self.total_commit_size += commit_size
+            self._add_bytes_on_disk(commit_size)
+            head_branch_name = self._step_branch(entry.commit_id, con=con)
+
+            # Update variable version tracker.
+            self._variable_version_tracker.update_variable_version(
+                entry.commit_id,
+                set() if changed_vars is None else changed_vars.added(),
+                set() if changed_vars is None else changed_vars.deleted())
+            # store variable version and commit-variable-version into database
+            self._kishu_variable_version.store_commit_variable_version_delta(
+                entry.commit_id,
+                self._last_variable_version_commit_id,
+                self._variable_version_tracker.get_variable_versions(),
+                set() if changed_vars is None else changed_vars.added(),
+                set() if changed_vars is None else changed_vars.deleted(),
+                con=con)
+            self._last_variable_version_commit_id = entry.commit_id
+            if changed_vars is not None:
+                self._kishu_variable_version.store_variable_version_table(
+                    changed_vars.added() | changed_vars.deleted(), entry.commit_id, con=con)
+
+        # The commit graph and head live outside the database, so only move them once the commit is stored.
         self._kishu_graph.step(entry.commit_id)
-        self._step_branch(entry.commit_id)
-
-        # Update variable version tracker.
-        self._variable_version_tracker.update_variable_version(entry.commit_id,
-                                                               set() if changed_vars is None else changed_vars.added(),
-                                                               set() if changed_vars is None else changed_vars.deleted())
-        # store variable version and commit-variable-version into database
-        self._kishu_variable_version.store_commit_variable_version_table(
-            entry.commit_id, self._variable_version_tracker.get_variable_versions())
-        if changed_vars is not None:
-            self._kishu_variable_version.store_variable_version_table(changed_vars.added()
-                                                                      | changed_vars.deleted(), entry.commit_id)
+        self._kishu_graph.flush()  # Other processes (e.g., kishu log) read the graph.
+        self._kishu_branch.update_head(head_branch_name, entry.commit_id)
+        self._step_executed_cells(entry)
 
         # Record cumulative checkpoint size if logging is enabled.
         if Config.get('EXPERIMENT', 'record_results', False):
-            file_sizes = sum(f.stat().st_size for f in Path(self.database_path()).parents[0].glob('**/*') if f.is_file())
-            self._cr_planner.write_row("checkpoint-size", file_sizes)
+            # Resync with the actual directory size every N records if configured (0 disables).
+            resync_interval = Config.get('EXPERIMENT', 'checkpoint_size_resync_interval', 0)
+            self._num_checkpoint_size_records += 1
+            if self._checkpoint_bytes_on_disk is None or (
+                resync_interval > 0 and self._num_checkpoint_size_records % resync_interval == 0
+            ):
+                self._checkpoint_bytes_on_disk = self._notebook_directory_size()
+            self._cr_planner.write_row("checkpoint-size", self._checkpoint_bytes_on_disk)
+
+    def _set_executed_cells(self, entry: CommitEntry) -> None:
+        """
+        Stores only the cells executed since the previous commit of this session, with that commit
+        as the base. Every EXECUTED_CELLS_SNAPSHOT_INTERVAL commits, the full list is stored instead
+        to bound the chain walked by KishuCommit.get_executed_cells.
+        """
+        executed_cells = self._user_ns.ipython_in()
+        if executed_cells is None:
+            return
+        entry.executed_cells_end = len(executed_cells)
+        if (
+            self._executed_cells_commit_id is None
+            or entry.executed_cells_end < self._executed_cells_end
+            or self._executed_cells_depth >= KishuForJupyter.EXECUTED_CELLS_SNAPSHOT_INTERVAL
+        ):
+            entry.executed_cells_start = 0
+        else:
+            entry.executed_cells_start = self._executed_cells_end
+            entry.executed_cells_base = self._executed_cells_commit_id
+        entry.executed_cells = executed_cells[entry.executed_cells_start:entry.executed_cells_end]
+
+    def _step_executed_cells(self, entry: CommitEntry) -> None:
+        if entry.executed_cells_end is None:
+            self._executed_cells_commit_id = None
+            return
+        self._executed_cells_depth = 0 if entry.executed_cells_base is None else self._executed_cells_depth + 1
+        self._executed_cells_commit_id = entry.commit_id
+        self._executed_cells_end = entry.executed_cells_end
+
+    @contextlib.contextmanager
+    def _commit_txn(self) -> Generator[sqlite3.Connection, None, None]:
+        """
+        Yields a connection holding a write transaction on the notebook database, committed on exit.
+        """
+        con = sqlite3.connect(self.database_path(), isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+        finally:
+            con.close()
+
+    def _notebook_directory_size(self) -> int:
+        return sum(f.stat().st_size for f in Path(self.database_path()).parents[0].glob('**/*') if f.is_file())
+
+    def _add_bytes_on_disk(self, num_bytes: int) -> None:
+        if self._checkpoint_bytes_on_disk is not None:
+            self._checkpoint_bytes_on_disk += num_bytes
 
     def _commit_id(self) -> str:
         if self._commit_id_mode == "counter":
@@ -700,7 +869,7 @@ class KishuForJupyter:
 
         # Step 2: checkpoint
         start = time.time()
-        checkpoint_plan.run(self._user_ns)
+        self._add_bytes_on_disk(checkpoint_plan.run(self._user_ns))
         self._cr_planner.write_row("checkpoint-time", time.time() - start)
         try:
             self._cr_planner.write_row("commit-table-size", self.total_commit_size + sys.getsizeof(self._cr_planner._ahg.serialize()))
@@ -708,7 +877,7 @@ class KishuForJupyter:
             self._cr_planner.write_row_text("commit-table-error", e)
 
         # Extra: generate variable version.
-        data_version = hash(pickle.dumps(self._cr_planner.get_ahg().get_variable_snapshots()))
+        data_version = self._cr_planner.get_ahg().get_variable_snapshots_digest()
         return restore_plan, data_version
 
     @staticmethod
@@ -720,8 +889,39 @@ class KishuForJupyter:
         ))
         return app
 
-    def _all_notebook_cells(self) -> Tuple[Optional[str], List[FormattedCell]]:
-        nb = JupyterRuntimeEnv.read_notebook(self._notebook_id.path())
+    def _all_notebook_cells(self) -> Tuple[Optional[str], List[FormattedCell], int]:
+        """
+        Returns the raw notebook, its formatted cells and its code version. The notebook is only
+        re-read when its mtime changes.
+        """
+        nb_path = self._notebook_id.path()
+        mtime = os.stat(nb_path).st_mtime_ns
+        if mtime != self._nb_cache_mtime:
+            self._nb_cache_raw, self._nb_cache_formatted = self._read_notebook_cells(nb_path)
+            self._nb_cache_code_version = self._code_version(self._nb_cache_formatted)
+            self._nb_cache_mtime = mtime
+        return self._nb_cache_raw, list(self._nb_cache_formatted), self._nb_cache_code_version
+
+    def _code_version(self, nb_cells: List[FormattedCell]) -> int:
+        """
+        Combines per-cell hashes salted with the cell index, re-hashing only cells whose type or
+        source changed since the last call.
+        """
+        code_version = len(nb_cells)
+        cell_hashes = {}
+        for idx, cell in enumerate(nb_cells):
+            cached = self._nb_cache_cell_hashes.get(idx)
+            if cached is not None and cached[0] == cell.cell_type and cached[1] == cell.source:
+                cell_hash = cached[2]
+            else:
+                cell_hash = hash((idx, cell.cell_type, cell.source))
+            cell_hashes[idx] = (cell.cell_type, cell.source, cell_hash)
+            code_version ^= cell_hash
+        self._nb_cache_cell_hashes = cell_hashes
+        return code_version
+
+    def _read_notebook_cells(self, nb_path: Path) -> Tuple[Optional[str], List[FormattedCell]]:
+        nb = JupyterRuntimeEnv.read_notebook(nb_path)
         nb_cells = []
         for cell in nb.cells:
             if cell.cell_type == "code":
@@ -746,24 +946,23 @@ class KishuForJupyter:
         if len(cell_outputs) == 0:
             return None
         for cell_output in cell_outputs:
-            # Filter auto-saving output.
-            if (
-                cell_output["output_type"] == "display_data" and
-                cell_output["data"].get("application/javascript", "") == KishuForJupyter.SAVE_CMD
-            ):
-                continue
+            output_type = cell_output["output_type"]
+            data = cell_output.get("data")
 
             # Now parse output into text.
-            if cell_output["output_type"] == "stream":
+            if output_type == "stream":
                 return cell_output["text"]
-            elif cell_output["output_type"] == "execute_result":
-                if "text/plain" in cell_output["data"]:
-                    return cell_output["data"].get("text/plain", "<execute_result>")
+            elif output_type == "execute_result":
+                if "text/plain" in data:
+                    return data["text/plain"]
                 else:
-                    raise ValueError(f"Unknown output data structure: {cell_output['data']}")
-            elif cell_output["output_type"] == "display_data":
-                return cell_output["data"].get("text/plain", "<display_data>")
-            elif cell_output["output_type"] == "error":
+                    raise ValueError(f"Unknown output data structure: {data}")
+            elif output_type == "display_data":
+                # Filter auto-saving output.
+                if data.get("application/javascript") == KishuForJupyter.SAVE_CMD:
+                    continue
+                return data.get("text/plain", "<display_data>")
+            elif output_type == "error":
                 return "\n".join([
                     *cell_output["traceback"],
                     f'{cell_output["ename"]}: {cell_output["evalue"]}',
@@ -772,36 +971,37 @@ class KishuForJupyter:
                 raise ValueError(f"Unknown output type: {cell_output}")
         return None
 
-    def _step_branch(self, commit_id: str) -> None:
-        head = self._kishu_branch.update_head(commit_id=commit_id)
-        if self._enable_auto_branch and head.branch_name is None:
-            new_branch_name = KishuBranch.random_branch_name()
-            self._kishu_branch.upsert_branch(new_branch_name, commit_id)
-            self._kishu_branch.update_head(new_branch_name, commit_id)
-        elif head.branch_name is not None:
-            self._kishu_branch.upsert_branch(head.branch_name, commit_id)
+    def _step_branch(self, commit_id: str, con: Optional[sqlite3.Connection] = None) -> Optional[str]:
+        """
+        Moves the head branch to the commit, creating one first when auto-branching, and returns its
+        name. The head file is left to the caller to update once the branch rows are committed.
+        """
+        branch_name = self._kishu_branch.get_head().branch_name
+        if self._enable_auto_branch and branch_name is None:
+            branch_name = KishuBranch.random_branch_name()
+        if branch_name is not None:
+            self._kishu_branch.upsert_branch(branch_name, commit_id, con=con)
+        return branch_name
 
     def _checkout_notebook(self, raw_nb: str) -> None:
         nb_path = self._notebook_id.path()
 
         # Read current notebook cells.
-        nb = JupyterRuntimeEnv.read_notebook(self._notebook_id.path())
+        nb = JupyterRuntimeEnv.read_notebook_json(nb_path)
 
-        # Apply target cells.
-        target_nb = nbformat.reads(raw_nb, JupyterRuntimeEnv.NBFORMAT_VERSION)
-        nb.cells = target_nb.cells
+        # Apply target cells. Both notebooks are in the on-disk layout, so cells are swapped as is.
+        nb["cells"] = json.loads(raw_nb)["cells"]
 
         # Save change
-        nbformat.write(nb, nb_path)
+        JupyterRuntimeEnv.write_notebook_json(nb, nb_path)
 
         # Reload frontend to reflect checked out notebook. This may prompts a confirmation dialog.
         self.reload_jupyter_frontend()
 
     def _checkout_namespace(self, user_ns: Namespace, target_ns: Namespace) -> None:
         user_ns.update(target_ns)
-        for key in list(user_ns.keyset()):
-            if key not in target_ns:
-                del user_ns[key]
+        for key in user_ns.keyset() - target_ns.keyset():
+            del user_ns[key]
 
 
 def repr_if_not_none(obj: Any) -> Optional[str]:
@@ -824,13 +1024,8 @@ def init_kishu(notebook_path: Optional[str] = None) -> None:
     kishu = KishuForJupyter(notebook_id, ip=ip)
     kishu.save_notebook()
 
-    # Open notebook file after saving.
-    nb = JupyterRuntimeEnv.read_notebook(notebook_id.path())
-
-    # Update notebook metadata.
-    metadata = notebook_id.create_kishu_metadata(nb)
-    NotebookId.add_kishu_metadata(nb, metadata)
-    nbformat.write(nb, notebook_id.path())
+    # Update notebook metadata after saving.
+    metadata = notebook_id.attach_kishu_metadata()
     kishu.set_session_id(metadata.session_count)
 
     # Attach Kishu instrumentation.
@@ -838,6 +1033,15 @@ def init_kishu(notebook_path: Optional[str] = None) -> None:
     kishu.reload_jupyter_frontend()
 
 
+def wait_for_idle() -> None:
+    """
+    Blocks until the attached Kishu instance has written all pending commits.
+    """
+    ip = eval('get_ipython()')
+    if ip is not None and KISHU_INSTRUMENT in ip.user_ns:
+        ip.user_ns[KISHU_INSTRUMENT].wait_for_idle()
+
+
 def detach_kishu(notebook_path: Optional[str] = None) -> None:
     # Create notebook id.
     notebook_id = NotebookId.from_enclosing(None if notebook_path is None else Path(notebook_path))
@@ -847,13 +1051,9 @@ def detach_kishu(notebook_path: Optional[str] = None) -> None:
     if ip is not None and KISHU_INSTRUMENT in ip.user_ns:
         ip.user_ns[KISHU_INSTRUMENT].uninstall_kishu_hooks()
 
-    # Open notebook file.
-    nb = JupyterRuntimeEnv.read_notebook(notebook_id.path())
-
     # Remove metadata from notebook.
     try:
-        NotebookId.remove_kishu_metadata(nb)
-        nbformat.write(nb, notebook_id.path())
+        notebook_id.detach_kishu_metadata()
     except MissingNotebookMetadataError:
         # This means that kishu metadata is not in the notebook, so do nothing.
         pass
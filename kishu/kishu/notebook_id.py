@@ -51,7 +51,7 @@ class NotebookId:
 
         # Retrieve key if any, otherwise create new key.
         try:
-            nb = JupyterRuntimeEnv.read_notebook(path)
+            nb = JupyterRuntimeEnv.read_notebook_json(path)
             metadata = NotebookId.read_kishu_metadata(nb)
             key = metadata.notebook_id
         except MissingNotebookMetadataError:
@@ -67,7 +67,7 @@ class NotebookId:
 
     @staticmethod
     def verify_metadata_exists(path: Path) -> bool:
-        nb = JupyterRuntimeEnv.read_notebook(path)
+        nb = JupyterRuntimeEnv.read_notebook_json(path)
         try:
             NotebookId.read_kishu_metadata(nb)
             return True
@@ -138,6 +138,24 @@ class NotebookId:
             raise MissingNotebookMetadataError()
         return KishuNotebookMetadata(**nb.metadata.kishu)
 
+    def attach_kishu_metadata(self) -> KishuNotebookMetadata:
+        """
+        Adds new Kishu metadata to the notebook file, parsing and writing the file once.
+        """
+        nb = JupyterRuntimeEnv.read_notebook_json(self._path)
+        metadata = self.create_kishu_metadata(nb)
+        NotebookId.add_kishu_metadata(nb, metadata)
+        JupyterRuntimeEnv.write_notebook_json(nb, self._path)
+        return metadata
+
+    def detach_kishu_metadata(self) -> None:
+        """
+        Removes Kishu metadata from the notebook file, parsing and writing the file once.
+        """
+        nb = JupyterRuntimeEnv.read_notebook_json(self._path)
+        NotebookId.remove_kishu_metadata(nb)
+        JupyterRuntimeEnv.write_notebook_json(nb, self._path)
+
     @staticmethod
     def add_kishu_metadata(nb: nbformat.NotebookNode, metadata: KishuNotebookMetadata) -> None:
         nb.metadata["kishu"] = asdict(metadata)
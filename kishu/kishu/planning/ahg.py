@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import dill
+import struct
 import time
+import xxhash
 
 from collections import defaultdict
 from dataclasses import dataclass, field
@@ -11,6 +13,20 @@ from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 from kishu.exceptions import MissingHistoryError
 from kishu.jupyter.namespace import Namespace
 
+try:
+    # Optional C parser built from lib/active_vsesmodule.c.
+    from c_active_vses import parse_active_vses as _c_parse_active_vses
+except ImportError:
+    _c_parse_active_vses = None
+
+
+"""
+Packed active variable snapshots: magic | u32 count | count x (i64 version | u16 num_names |
+num_names x (u16 len | utf-8 name)), little endian. Older commits store a dill-pickled list of
+VersionedName instead.
+"""
+ACTIVE_VSES_MAGIC = b"KVS1"
+
 
 @dataclass
 class CellExecution:
@@ -93,6 +109,14 @@ class AHG:
         # The values are a subset of self._variable_snapshots.
         self._active_variable_snapshots: Dict[FrozenSet[str], VariableSnapshot] = {}
 
+        # Order-independent digest over the versioned names of all variable snapshots, folded in
+        # incrementally as variable snapshots are added.
+        self._variable_snapshots_digest = 0
+
+        # Versions of the active variable snapshots by name, rebuilt lazily after they change.
+        self._active_versions: Dict[FrozenSet[str], int] = {}
+        self._active_versions_dirty = False
+
     @staticmethod
     def from_existing(user_ns: Namespace) -> AHG:
         ahg = AHG()
@@ -217,9 +241,15 @@ class AHG:
         # Add created and modified VSes to the active variables list.
         self._active_variable_snapshots.update({vs.name: vs for vs in output_vss_create})
         self._active_variable_snapshots.update({vs.name: vs for vs in output_vss_modify})
+        self._active_versions_dirty = True
 
         for vs in output_vss_create + output_vss_modify + output_vss_delete:
-            self._variable_snapshots[VersionedName(vs.name, vs.version)] = vs
+            versioned_name = VersionedName(vs.name, vs.version)
+            if versioned_name not in self._variable_snapshots:
+                self._variable_snapshots_digest = (
+                    self._variable_snapshots_digest + AHG._digest_versioned_name(versioned_name)
+                ) & 0xFFFFFFFFFFFFFFFF
+            self._variable_snapshots[versioned_name] = vs
         #REVISION-----
         # self._variable_snapshots += output_vss_create + output_vss_modify + output_vss_delete
 
@@ -229,9 +259,24 @@ class AHG:
     def get_variable_snapshots(self) -> List[VariableSnapshot]:
         return self._variable_snapshots
 
+    def get_variable_snapshots_digest(self) -> int:
+        """
+            Returns a 64-bit digest identifying the set of variable snapshots in the session.
+        """
+        return self._variable_snapshots_digest
+
     def get_active_variable_snapshots(self) -> List[VariableSnapshot]:
         return list(self._active_variable_snapshots.values())
 
+    def get_active_versions(self) -> Dict[FrozenSet[str], int]:
+        """
+            Returns the version of each active variable snapshot keyed by its name. Must not be modified.
+        """
+        if self._active_versions_dirty:
+            self._active_versions = {name: vs.version for name, vs in self._active_variable_snapshots.items()}
+            self._active_versions_dirty = False
+        return self._active_versions
+
     def get_active_variable_snapshots_dict(self) -> Dict[FrozenSet[str], VariableSnapshot]:
         return self._active_variable_snapshots
 
@@ -255,7 +300,14 @@ class AHG:
 
     #REVISION-----
     def serialize_active_vses(self) -> str:
-        return dill.dumps([VersionedName(vs.name, vs.version) for vs in self.get_active_variable_snapshots()]).decode('latin1')
+        parts = [ACTIVE_VSES_MAGIC, struct.pack("<I", len(self._active_variable_snapshots))]
+        for name, vs in self._active_variable_snapshots.items():
+            parts.append(struct.pack("<qH", vs.version, len(name)))
+            for var_name in sorted(name):
+                var_name_bytes = var_name.encode()
+                parts.append(struct.pack("<H", len(var_name_bytes)))
+                parts.append(var_name_bytes)
+        return b"".join(parts).decode('latin1')
 
     #REVISION-----
     def get_vs_by_versioned_name(self, versioned_name: VersionedName) -> VariableSnapshot:
@@ -263,13 +315,48 @@ class AHG:
 
     #REVISION-----
     @staticmethod
-    def deserialize_active_vses(active_vs_string: str) -> List[VersionedName]:
-        return dill.loads(active_vs_string.encode('latin1'))
+    def deserialize_active_vses(active_vs_string: str) -> Dict[FrozenSet[str], int]:
+        """
+            Returns the version of each active variable snapshot keyed by its name.
+        """
+        buf = active_vs_string.encode('latin1')
+        if not buf.startswith(ACTIVE_VSES_MAGIC):
+            return {vn.name: vn.version for vn in dill.loads(buf)}
+        if _c_parse_active_vses is not None:
+            return _c_parse_active_vses(buf)
+        return AHG._parse_active_vses(buf)
+
+    @staticmethod
+    def _parse_active_vses(buf: bytes) -> Dict[FrozenSet[str], int]:
+        result = {}
+        (count,) = struct.unpack_from("<I", buf, len(ACTIVE_VSES_MAGIC))
+        offset = len(ACTIVE_VSES_MAGIC) + 4
+        for _ in range(count):
+            version, num_names = struct.unpack_from("<qH", buf, offset)
+            offset += 10
+            var_names = []
+            for _ in range(num_names):
+                (var_name_len,) = struct.unpack_from("<H", buf, offset)
+                offset += 2
+                var_names.append(buf[offset:offset + var_name_len].decode())
+                offset += var_name_len
+            result[frozenset(var_names)] = version
+        return result
 
     def replace_active_vses(self, versioned_names: List[VersionedName]) -> None:
         self._active_variable_snapshots.clear()
         for versioned_name in versioned_names:
             self._active_variable_snapshots[versioned_name.name] = self._variable_snapshots[versioned_name]
+        self._active_versions_dirty = True
+
+    @staticmethod
+    def _digest_versioned_name(versioned_name: VersionedName) -> int:
+        h = xxhash.xxh3_64()
+        for name in sorted(versioned_name.name):
+            h.update(name.encode())
+            h.update(b"\0")
+        h.update(versioned_name.version.to_bytes(8, 'little', signed=True))
+        return h.intdigest()
 
     @staticmethod
     def union_find(variables: Set[str], linked_variables: List[Tuple[str, str]]) -> Set[FrozenSet[str]]:
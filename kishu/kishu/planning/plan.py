@@ -15,6 +15,7 @@ from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple, U
 from kishu.exceptions import CommitIdNotExistError, DuplicateRestoreActionError
 from kishu.jupyter.namespace import Namespace
 from kishu.planning.ahg import VariableSnapshot, VersionedName, VersionedNameContext
+from kishu.storage import serialization
 from kishu.storage.checkpoint import KishuCheckpoint
 
 
@@ -59,11 +60,11 @@ class VarNamesToObjects:
     object_dict: Dict[str, Any] = field(default_factory=lambda: {})
 
     def dumps(self) -> bytes:
-        return dill.dumps(self.object_dict)
+        return serialization.dumps(self.object_dict)
 
     @staticmethod
     def loads(data: bytes) -> VarNamesToObjects:
-        object_dict = dill.loads(data)
+        object_dict = serialization.loads(data)
         res = VarNamesToObjects()
         for key, obj in object_dict.items():
             res[key] = obj
@@ -83,7 +84,7 @@ class VarNamesToObjects:
 
 
 class CheckpointAction:
-    def run(self, user_ns: Namespace):
+    def run(self, user_ns: Namespace) -> int:
         raise NotImplementedError("Must be extended by inherited classes.")
 
 
@@ -96,7 +97,7 @@ class SaveVariablesCheckpointAction(CheckpointAction):
         self.filename: Optional[str] = None
         self.exec_id: Optional[str] = None
 
-    def run(self, user_ns: Namespace):
+    def run(self, user_ns: Namespace) -> int:
         if self.filename is None:
             raise ValueError("filename is not set.")
         if self.exec_id is None:
@@ -104,7 +105,7 @@ class SaveVariablesCheckpointAction(CheckpointAction):
         namespace: VarNamesToObjects = VarNamesToObjects()
         for name in self.variable_names:
             namespace[name] = user_ns[name]
-        KishuCheckpoint(self.filename).store_checkpoint(self.exec_id, namespace.dumps())
+        return KishuCheckpoint(self.filename).store_checkpoint(self.exec_id, namespace.dumps())
 
 
 class IncrementalWriteCheckpointAction(CheckpointAction):
@@ -116,8 +117,8 @@ class IncrementalWriteCheckpointAction(CheckpointAction):
         self.filename = filename
         self.exec_id = exec_id
 
-    def run(self, user_ns: Namespace):
-        KishuCheckpoint(self.filename).store_variable_snapshots(self.exec_id, self.vses_to_store, user_ns)
+    def run(self, user_ns: Namespace) -> int:
+        return KishuCheckpoint(self.filename).store_variable_snapshots(self.exec_id, self.vses_to_store, user_ns)
 
 
 class CheckpointPlan:
@@ -172,9 +173,11 @@ class CheckpointPlan:
                 raise ValueError("Checkpointing a non-existenting var: {}".format(name))
         return var_names
 
-    def run(self, user_ns: Namespace) -> None:
-        for action in self.actions:
-            action.run(user_ns)
+    def run(self, user_ns: Namespace) -> int:
+        """
+        Returns the number of data bytes written.
+        """
+        return sum(action.run(user_ns) for action in self.actions)
 
 
 class IncrementalCheckpointPlan:
@@ -230,11 +233,14 @@ class IncrementalCheckpointPlan:
             )
         ]
 
-    def run(self, user_ns: Namespace) -> None:
+    def run(self, user_ns: Namespace) -> int:
+        """
+        Returns the number of data bytes written.
+        """
         user_ns.turn_off_track()
-        for action in self.actions:
-            action.run(user_ns)
+        bytes_written = sum(action.run(user_ns) for action in self.actions)
         user_ns.turn_on_track()
+        return bytes_written
 
 
 class RestoreAction:
@@ -318,7 +324,7 @@ class IncrementalLoadRestoreAction(RestoreAction):
         dictionaries = []
         for i in data:
             try:
-                dictionaries.append(cloudpickle.loads(i))
+                dictionaries.append(serialization.loads_out_of_band(i, cloudpickle.loads))
             except:
                 dictionaries.append(dill.loads(i))
         for dictionary in dictionaries:
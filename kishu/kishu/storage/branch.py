@@ -1,24 +1,30 @@
 from __future__ import annotations
 
+import functools
+import itertools
 import json
-import random
+import os
 import sqlite3
+import struct
 
 from dataclasses import dataclass
-from dataclasses_json import dataclass_json
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
 from kishu.exceptions import (
     BranchNotFoundError,
     BranchConflictError,
 )
+from kishu.storage.connection import CachedConnection
 from kishu.storage.path import KishuPath
 
 
 BRANCH_TABLE = 'branch'
 
+# Below SQLite's default SQLITE_MAX_VARIABLE_NUMBER (999) of older versions.
+MAX_QUERY_PARAMS = 900
 
-BRANCH_NAME_ADJECTIVES = [
+
+BRANCH_NAME_ADJECTIVES = (
     "agile",
     "algebraic",
     "analytic",
@@ -79,10 +85,10 @@ BRANCH_NAME_ADJECTIVES = [
     "trigonometric",
     "vibrant",
     "viscous",
-]
+)
 
 
-BRANCH_NAME_NOUNS = [
+BRANCH_NAME_NOUNS = (
     "allele",
     "atom",
     "bacteria",
@@ -143,18 +149,32 @@ BRANCH_NAME_NOUNS = [
     "valve",
     "vesicle",
     "wave",
-]
+)
+
+
+@functools.lru_cache(maxsize=32)
+def _branches_for_many_commits_sql(num_commit_ids: int) -> str:
+    return f"select branch_name, commit_id from {BRANCH_TABLE} where commit_id in ({', '.join('?' * num_commit_ids)})"
 
 
-@dataclass_json
 @dataclass
 class HeadBranch:
+    __slots__ = ("branch_name", "commit_id")
     branch_name: Optional[str]
     commit_id: Optional[str]
 
+    def to_json(self) -> str:
+        return json.dumps({"branch_name": self.branch_name, "commit_id": self.commit_id})
+
+    @staticmethod
+    def from_json(json_str: Union[str, bytes]) -> HeadBranch:
+        head_dict = json.loads(json_str)
+        return HeadBranch(head_dict.get("branch_name"), head_dict.get("commit_id"))
+
 
 @dataclass
 class BranchRow:
+    __slots__ = ("branch_name", "commit_id")
     branch_name: str
     commit_id: str
 
@@ -164,20 +184,36 @@ class KishuBranch:
     def __init__(self, notebook_id: str):
         self.database_path = KishuPath.database_path(notebook_id)
         self.head_path = KishuPath.head_path(notebook_id)
+        self._connection = CachedConnection(self.database_path)
+
+        # Parsed head, valid while the head file's (inode, mtime, size) is unchanged. Heads are
+        # written by replacing the file, so every write changes the inode.
+        self._head_cache: Optional[Tuple[Tuple[int, int, int], HeadBranch]] = None
+
+        # Whether the branch table is known to exist.
+        self._table_ready = False
 
     def init_database(self):
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         cur.execute(f'create table if not exists {BRANCH_TABLE} (branch_name text primary key, commit_id text)')
-        con.commit()
+        self._table_ready = True
+
+    def _cursor(self) -> sqlite3.Cursor:
+        if not self._table_ready:
+            self.init_database()
+        return self._connection.get().cursor()
 
     def get_head(self) -> HeadBranch:
         try:
-            with open(self.head_path, "r") as f:
-                json_str = f.read()
-                return HeadBranch.from_json(json_str)  # type: ignore
+            head_stat = os.stat(self.head_path)
+            head_key = (head_stat.st_ino, head_stat.st_mtime_ns, head_stat.st_size)
+            if self._head_cache is None or self._head_cache[0] != head_key:
+                with open(self.head_path, "rb") as f:
+                    self._head_cache = (head_key, HeadBranch.from_json(f.read()))
         except (FileNotFoundError, json.decoder.JSONDecodeError):
             return HeadBranch(branch_name=None, commit_id=None)
+        head = self._head_cache[1]
+        return HeadBranch(head.branch_name, head.commit_id)
 
     def update_head(
         self,
@@ -201,115 +237,84 @@ class KishuBranch:
             head.commit_id = commit_id
 
         # Write head.
-        with open(self.head_path, 'w') as f:
-            f.write(head.to_json())  # type: ignore
+        tmp_head_path = f"{self.head_path}.tmp"
+        with open(tmp_head_path, 'w') as f:
+            f.write(head.to_json())
+        os.replace(tmp_head_path, self.head_path)
+        head_stat = os.stat(self.head_path)
+        self._head_cache = (
+            (head_stat.st_ino, head_stat.st_mtime_ns, head_stat.st_size),
+            HeadBranch(head.branch_name, head.commit_id),
+        )
         return head
 
-    def upsert_branch(self, branch: str, commit_id: str) -> None:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+    def upsert_branch(self, branch: str, commit_id: str, con: Optional[sqlite3.Connection] = None) -> None:
+        cur = (con or self._connection.get()).cursor()
         query = f"insert or replace into {BRANCH_TABLE} values (?, ?)"
         cur.execute(query, (branch, commit_id))
-        con.commit()
 
     def list_branch(self) -> List[BranchRow]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._cursor()
         query = f"select branch_name, commit_id from {BRANCH_TABLE}"
-        try:
-            cur.execute(query)
-            return [
-                BranchRow(branch_name=branch_name, commit_id=commit_id)
-                for branch_name, commit_id in cur
-            ]
-        except sqlite3.OperationalError:
-            # No such table means no branch
-            return []
-        finally:
-            con.close()
+        cur.execute(query)
+        return list(itertools.starmap(BranchRow, cur.fetchall()))
 
     def get_branch(self, branch_name: str) -> List[BranchRow]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._cursor()
         query = f"select branch_name, commit_id from {BRANCH_TABLE} where branch_name = ?"
-        try:
-            cur.execute(query, (branch_name,))
-            return [
-                BranchRow(branch_name=branch_name, commit_id=commit_id)
-                for branch_name, commit_id in cur
-            ]
-        except sqlite3.OperationalError:
-            # No such table means no branch
-            return []
-        finally:
-            con.close()
+        cur.execute(query, (branch_name,))
+        return list(itertools.starmap(BranchRow, cur.fetchall()))
 
     def branches_for_commit(self, commit_id: str) -> List[BranchRow]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._cursor()
         query = f"select branch_name, commit_id from {BRANCH_TABLE} where commit_id = ?"
-        try:
-            cur.execute(query, (commit_id,))
-            return [
-                BranchRow(branch_name=branch_name, commit_id=commit_id)
-                for branch_name, commit_id in cur
-            ]
-        except sqlite3.OperationalError:
-            # No such table means no branch
-            return []
-        finally:
-            con.close()
+        cur.execute(query, (commit_id,))
+        return list(itertools.starmap(BranchRow, cur.fetchall()))
 
     def branches_for_many_commits(self, commit_ids: List[str],) -> Dict[str, List[BranchRow]]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        query = "select branch_name, commit_id from {} where commit_id in ({})".format(
-            BRANCH_TABLE,
-            ', '.join('?' * len(commit_ids))
-        )
-        try:
-            cur.execute(query, commit_ids)
-        except sqlite3.OperationalError:
-            # No such table means no branch
+        if len(commit_ids) == 0:
             return {}
-        raw_branches = cur.fetchall()
+        if len(commit_ids) == 1:
+            branches = self.branches_for_commit(commit_ids[0])
+            return {commit_ids[0]: branches} if branches else {}
+
+        # Query in batches to stay under SQLite's limit on the number of parameters.
+        cur = self._cursor()
         branch_by_commit: Dict[str, List[BranchRow]] = {}
-        for branch_name, commit_id in raw_branches:
-            if commit_id not in branch_by_commit:
-                branch_by_commit[commit_id] = []
-            branch_by_commit[commit_id].append(BranchRow(
-                branch_name=branch_name,
-                commit_id=commit_id,
-            ))
-        con.close()
+        for i in range(0, len(commit_ids), MAX_QUERY_PARAMS):
+            batch = commit_ids[i:i + MAX_QUERY_PARAMS]
+            cur.execute(_branches_for_many_commits_sql(len(batch)), batch)
+            for branch_name, commit_id in cur.fetchall():
+                if commit_id not in branch_by_commit:
+                    branch_by_commit[commit_id] = []
+                branch_by_commit[commit_id].append(BranchRow(branch_name, commit_id))
         return branch_by_commit
 
     def delete_branch(self, branch_name: str) -> None:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-
         head = self.get_head()
         if branch_name == head.branch_name:
             raise BranchConflictError("Cannot delete the currently checked-out branch.")
-        if not KishuBranch._contains_branch(cur, branch_name):
-            raise BranchNotFoundError(branch_name)
 
-        query = f"delete from {BRANCH_TABLE} where branch_name = ?"
-        cur.execute(query, (branch_name,))
-        con.commit()
+        if not self._table_ready:
+            self.init_database()
+        with self._connection.transaction() as cur:
+            if not KishuBranch._contains_branch(cur, branch_name):
+                raise BranchNotFoundError(branch_name)
 
-    def rename_branch(self, old_name: str, new_name: str) -> None:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+            query = f"delete from {BRANCH_TABLE} where branch_name = ?"
+            cur.execute(query, (branch_name,))
 
-        if not KishuBranch._contains_branch(cur, old_name):
-            raise BranchNotFoundError(old_name)
-        if KishuBranch._contains_branch(cur, new_name):
-            raise BranchConflictError("The provided new branch name already exists.")
+    def rename_branch(self, old_name: str, new_name: str) -> None:
+        if not self._table_ready:
+            self.init_database()
+        with self._connection.transaction() as cur:
+            if not KishuBranch._contains_branch(cur, old_name):
+                raise BranchNotFoundError(old_name)
+            if KishuBranch._contains_branch(cur, new_name):
+                raise BranchConflictError("The provided new branch name already exists.")
 
-        query = f"update {BRANCH_TABLE} set branch_name = ? where branch_name = ?"
-        cur.execute(query, (new_name, old_name))
-        con.commit()
+            query = f"update {BRANCH_TABLE} set branch_name = ? where branch_name = ?"
+            cur.execute(query, (new_name, old_name))
 
         # Update HEAD branch if HEAD is on branch
         head = self.get_head()
@@ -318,9 +323,11 @@ class KishuBranch:
 
     @staticmethod
     def random_branch_name() -> str:
-        adj_idx = random.randint(0, len(BRANCH_NAME_ADJECTIVES) - 1)
-        noun_idx = random.randint(0, len(BRANCH_NAME_NOUNS) - 1)
-        return f"{BRANCH_NAME_ADJECTIVES[adj_idx]}_{BRANCH_NAME_NOUNS[noun_idx]}"
+        # One getrandom() call instead of the random module's shared Mersenne Twister state.
+        adj_idx, noun_idx = struct.unpack("<HH", os.urandom(4))
+        adjective = BRANCH_NAME_ADJECTIVES[adj_idx % len(BRANCH_NAME_ADJECTIVES)]
+        noun = BRANCH_NAME_NOUNS[noun_idx % len(BRANCH_NAME_NOUNS)]
+        return f"{adjective}_{noun}"
 
     @staticmethod
     def _contains_branch(cur: sqlite3.Cursor, branch_name: str) -> bool:
@@ -12,6 +12,7 @@ from typing import Dict, FrozenSet, List, Set, Tuple
 from kishu.exceptions import CommitIdNotExistError
 from kishu.jupyter.namespace import Namespace
 from kishu.planning.ahg import VariableSnapshot, VersionedName, VersionedNameContext
+from kishu.storage import serialization
 from kishu.storage.config import Config
 
 
@@ -45,14 +46,18 @@ class KishuCheckpoint:
         result = res[0]
         return result
 
-    def store_checkpoint(self, commit_id: str, data: bytes) -> None:
+    def store_checkpoint(self, commit_id: str, data: bytes) -> int:
+        """
+        Returns the number of data bytes written.
+        """
         con = sqlite3.connect(self.database_path)
         cur = con.cursor()
         cur.execute(
             f"insert into {CHECKPOINT_TABLE} values (?, ?)",
-            (commit_id, memoryview(data))
+            (commit_id, data)
         )
         con.commit()
+        return len(data)
 
     def get_variable_snapshots(self, versioned_names: List[Tuple[VersionedName, VersionedNameContext]]) -> List[bytes]:
         con = sqlite3.connect(self.database_path)
@@ -77,9 +82,13 @@ class KishuCheckpoint:
         res: List = cur.fetchall()
         return {VersionedName(frozenset(ast.literal_eval(i[1])), i[0]): VersionedNameContext(i[2], i[3]) for i in res}
 
-    def store_variable_snapshots(self, commit_id: str, vses_to_store: List[VariableSnapshot], user_ns: Namespace) -> None:
+    def store_variable_snapshots(self, commit_id: str, vses_to_store: List[VariableSnapshot], user_ns: Namespace) -> int:
+        """
+        Returns the number of data bytes written.
+        """
         con = sqlite3.connect(self.database_path)
         cur = con.cursor()
+        bytes_written = 0
 
         # Store each variable snapshot.
         for vs in vses_to_store:
@@ -87,7 +96,7 @@ class KishuCheckpoint:
             ns_subset = user_ns.subset(set(vs.name))
 
             try:
-                data_dump = cloudpickle.dumps(ns_subset.to_dict())
+                data_dump = serialization.dumps_out_of_band(ns_subset.to_dict(), cloudpickle.dumps)
             except:
                 try:
                     data_dump = dill.dumps(ns_subset.to_dict())
@@ -96,9 +105,11 @@ class KishuCheckpoint:
             try:
                 cur.execute(
                     f"insert into {VARIABLE_SNAPSHOT_TABLE} values (?, ?, ?, ?, ?)",
-                    (vs.version, repr(sorted(vs.name)), commit_id, sys.getsizeof(data_dump), memoryview(data_dump))
+                    (vs.version, repr(sorted(vs.name)), commit_id, sys.getsizeof(data_dump), data_dump)
                 )
                 con.commit()
+                bytes_written += len(data_dump)
             except:
                 # If storage fails, don't do anything. The VariableSnapshot will be reconstructed upon checkout.
                 pass
+        return bytes_written
@@ -8,21 +8,51 @@ There three types of information:
 """
 from __future__ import annotations
 
-import dill
+import copy
+import dataclasses
 import enum
+import functools
+import hashlib
 import sqlite3
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, List, Optional
-import sys
+from typing import Any, Dict, List, Optional, Tuple
 
 import kishu.planning.plan
 
 from kishu.exceptions import MissingCommitEntryError
+from kishu.storage import serialization
+from kishu.storage.config import Config
+from kishu.storage.connection import CachedConnection
 from kishu.storage.path import KishuPath
 
 
 COMMIT_ENTRY_TABLE = 'commit_entry'
 SESSION_STATE_TABLE = 'session_state'
+RAW_NB_TABLE = 'raw_nb'
+
+# zlib level for commit entries; 0 stores them uncompressed.
+COMPRESSION_LEVEL = Config.get('COMMIT', 'compression_level', 1)
+
+# Fixed query strings, so that sqlite3's statement cache reuses their compiled statements.
+INSERT_COMMIT_ENTRY_SQL = f"insert into {COMMIT_ENTRY_TABLE} values (?, ?)"
+INSERT_SESSION_STATE_SQL = f"insert into {SESSION_STATE_TABLE} values (?, ?)"
+UPDATE_COMMIT_ENTRY_SQL = f"update {COMMIT_ENTRY_TABLE} set data = ? where commit_id = ?"
+SELECT_COMMIT_ENTRY_SQL = f"select data from {COMMIT_ENTRY_TABLE} where commit_id = ?"
+SELECT_SESSION_STATE_SQL = f"select data from {SESSION_STATE_TABLE} where commit_id = ?"
+CREATE_RAW_NB_TABLE_SQL = f"create table if not exists {RAW_NB_TABLE} (nb_hash text primary key, content blob)"
+INSERT_RAW_NB_SQL = f"insert or ignore into {RAW_NB_TABLE} values (?, ?)"
+SELECT_RAW_NB_EXISTS_SQL = f"select 1 from {RAW_NB_TABLE} where nb_hash = ?"
+
+
+@functools.lru_cache(maxsize=32)
+def _select_many_sql(table: str, num_commit_ids: int) -> str:
+    return f"select commit_id, data from {table} where commit_id in ({', '.join('?' * num_commit_ids)})"
+
+
+@functools.lru_cache(maxsize=32)
+def _select_raw_nbs_sql(num_hashes: int) -> str:
+    return f"select nb_hash, content from {RAW_NB_TABLE} where nb_hash in ({', '.join('?' * num_hashes)})"
 
 
 class CommitEntryKind(str, enum.Enum):
@@ -57,13 +87,23 @@ class CommitEntry:
     @param checkpoint_vars  The variable names that are checkpointed after the cell execution.
     @param restore_plan  The checkpoint algorithm also sets this restoration plan, which
             when executed, restores all the variables as they are.
+    @param raw_nb_hash  Content hash of raw_nb. raw_nb is stored once per distinct content in its
+            own table and joined back when the commit entry is read.
+    @param executed_cells  The executed cells, In[executed_cells_start:executed_cells_end]. Entries
+            written before executed_cells_start was introduced hold the full list.
+    @param executed_cells_base  The commit whose executed cells precede executed_cells, i.e., ends at
+            executed_cells_start. None when executed_cells_start is 0.
     """
     commit_id: str = ""
     kind: CommitEntryKind = CommitEntryKind.unspecified
 
     checkpoint_runtime_s: Optional[float] = None
     executed_cells: Optional[List[str]] = None
+    executed_cells_start: Optional[int] = None
+    executed_cells_end: Optional[int] = None
+    executed_cells_base: Optional[str] = None
     raw_nb: Optional[str] = None
+    raw_nb_hash: Optional[str] = None
     formatted_cells: Optional[List[FormattedCell]] = None
     restore_plan: Optional[kishu.planning.plan.RestorePlan] = None
     message: str = ""
@@ -89,72 +129,132 @@ class CommitEntry:
         return None
 
 
+class LazyCommitEntry:
+    """
+    A read-only view of a stored CommitEntry that fetches and decodes data on first attribute
+    access. active_vses_string is read from its own table; any other field decodes the full commit
+    entry once. Decoded fields are cached on the instance, so later accesses are plain lookups;
+    callers that already hold a field (e.g., from a batched query) may assign it up front.
+    """
+    def __init__(self, kishu_commit: KishuCommit, commit_id: str):
+        self.commit_id = commit_id
+        self._kishu_commit = kishu_commit
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name == "active_vses_string":
+            value = self._kishu_commit.get_session_state(self.commit_id)
+        else:
+            value = getattr(self._commit_entry(), name)
+        setattr(self, name, value)
+        return value
+
+    def _commit_entry(self) -> CommitEntry:
+        if "_entry" not in self.__dict__:
+            self._entry = self._kishu_commit.get_commit(self.commit_id)
+        return self._entry
+
+
 class KishuCommit:
+    ENTRY_CACHE_SIZE = 256
+
     def __init__(self, notebook_id: str):
         self.database_path = KishuPath.database_path(notebook_id)
+        self._connection = CachedConnection(self.database_path)
+
+        # Deserialized commit entries by commit ID, least recently used first.
+        # Entries are handed out as shallow copies so callers cannot change the cached ones.
+        self._entry_cache: OrderedDict[str, CommitEntry] = OrderedDict()
+
+        # The connection and its data version the cache was last validated against.
+        self._entry_cache_version: Optional[Tuple[sqlite3.Connection, int]] = None
+
+        # The last stored raw notebook and its hash; unchanged notebooks are usually the same object.
+        self._last_raw_nb: Optional[str] = None
+        self._last_raw_nb_hash: Optional[str] = None
 
     def init_database(self):
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         cur.execute(f'create table if not exists {COMMIT_ENTRY_TABLE} (commit_id text primary key, data blob)')
         cur.execute(f'create table if not exists {SESSION_STATE_TABLE} (commit_id text primary key, data blob)')
+        cur.execute(CREATE_RAW_NB_TABLE_SQL)
         # cur.execute(f'create unique index session_state_idx on {SESSION_STATE_TABLE}(commit_id)')
         # cur.execute(f'create unique index commit_entry_idx on {COMMIT_ENTRY_TABLE}(commit_id)')
-        con.commit()
 
-    def store_commit(self, commit_entry: CommitEntry) -> None:
-        commit_entry_dill = dill.dumps(commit_entry)
-        session_state_dill = dill.dumps(commit_entry.active_vses_string)
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        cur.execute(
-            f"insert into {COMMIT_ENTRY_TABLE} values (?, ?)",
-            (commit_entry.commit_id, memoryview(commit_entry_dill))
-        )
-        con.commit()
-        cur.execute(
-            f"insert into {SESSION_STATE_TABLE} values (?, ?)",
-            (commit_entry.commit_id, memoryview(session_state_dill))
-        )
-        con.commit()
-        return sys.getsizeof(dill.dumps(commit_entry.active_vses_string))
+    def store_commit(self, commit_entry: CommitEntry, con: Optional[sqlite3.Connection] = None) -> int:
+        """
+        @param con  If given, writes within the caller's transaction on this connection without
+                committing.
+        """
+        session_state_data = KishuCommit._encode_session_state(commit_entry.active_vses_string)
+        with self._connection.transaction(con) as cur:
+            commit_entry_data = self._encode_commit_entry(cur, commit_entry)
+            cur.execute(INSERT_COMMIT_ENTRY_SQL, (commit_entry.commit_id, commit_entry_data))
+            cur.execute(INSERT_SESSION_STATE_SQL, (commit_entry.commit_id, session_state_data))
+        return 0 if session_state_data is None else len(session_state_data)
 
     def update_commit(self, commit_entry: CommitEntry) -> None:
-        commit_entry_dill = dill.dumps(commit_entry)
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        cur.execute(
-            f"update {COMMIT_ENTRY_TABLE} set data = ? where commit_id = ?",
-            (memoryview(commit_entry_dill), commit_entry.commit_id)
-        )
-        con.commit()
+        with self._connection.transaction() as cur:
+            # Databases created by older versions may lack the raw notebook table.
+            cur.execute(CREATE_RAW_NB_TABLE_SQL)
+            commit_entry_data = self._encode_commit_entry(cur, commit_entry)
+            cur.execute(UPDATE_COMMIT_ENTRY_SQL, (commit_entry_data, commit_entry.commit_id))
+        self._entry_cache.pop(commit_entry.commit_id, None)
 
     def get_commit(self, commit_id: str) -> CommitEntry:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        cur.execute(
-            f"select data from {COMMIT_ENTRY_TABLE} where commit_id = ?",
-            (commit_id, )
-        )
+        cur = self._connection.get().cursor()
+        self._validate_entry_cache(cur)
+        if commit_id in self._entry_cache:
+            self._entry_cache.move_to_end(commit_id)
+            return copy.copy(self._entry_cache[commit_id])
+        cur.execute(SELECT_COMMIT_ENTRY_SQL, (commit_id, ))
         res: tuple = cur.fetchone()
         if not res:
             raise MissingCommitEntryError(commit_id)
-        result = dill.loads(res[0])
-        con.commit()
-        return result
+        result = serialization.loads(res[0])
+        self._join_raw_nbs(cur, [result])
+        self._cache_entry(result)
+        return copy.copy(result)
+
+    def get_lazy_commit(self, commit_id: str) -> LazyCommitEntry:
+        """
+        Returns a view of the commit whose fields are only fetched and decoded when accessed.
+        """
+        return LazyCommitEntry(self, commit_id)
 
     def get_session_state(self, commit_id: str):
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        cur.execute(
-            f"select data from {SESSION_STATE_TABLE} where commit_id = ?",
-            (commit_id, )
-        )
+        cur = self._connection.get().cursor()
+        cur.execute(SELECT_SESSION_STATE_SQL, (commit_id, ))
         res: tuple = cur.fetchone()
         if not res:
             raise MissingCommitEntryError(commit_id)
-        result = dill.loads(res[0])
-        con.commit()
+        result = KishuCommit._decode_session_state(res[0])
+        return result
+
+    def get_executed_cells(self, commit_entry: CommitEntry) -> Optional[List[str]]:
+        """
+        Returns all executed cells of the commit by concatenating its executed cell deltas with
+        those of its base commits.
+        """
+        deltas: List[List[str]] = []
+        while True:
+            if commit_entry.executed_cells is None:
+                return None
+            deltas.append(commit_entry.executed_cells)
+            if not commit_entry.executed_cells_start or commit_entry.executed_cells_base is None:
+                break
+            commit_entry = self.get_commit(commit_entry.executed_cells_base)
+        return [cell for delta in reversed(deltas) for cell in delta]
+
+    def get_session_states(self, commit_ids: List[str]) -> Dict[str, str]:
+        """
+        Returns a mapping from requested commit ID to its session state. Commit IDs without a
+        session state are absent.
+        """
+        cur = self._connection.get().cursor()
+        cur.execute(_select_many_sql(SESSION_STATE_TABLE, len(commit_ids)), commit_ids)
+        result = {commit_id: KishuCommit._decode_session_state(data) for commit_id, data in cur.fetchall()}
         return result
 
     def get_commits(self, commit_ids: List[str]) -> Dict[str, CommitEntry]:
@@ -162,23 +262,96 @@ class KishuCommit:
         Returns a mapping from requested commit ID to its data. Order and completeness are not
         guaranteed (i.e. not all commit IDs may be present). Data bytes are those from store_commit
         """
-        result = {}
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        query = (
-            f"select commit_id, data from {COMMIT_ENTRY_TABLE} "
-            f"where commit_id in ({', '.join('?' * len(commit_ids))})"
-        )
-        cur.execute(query, commit_ids)
-        res = cur.fetchall()
-        for key, data in res:
-            result[key] = dill.loads(data)
-        con.commit()
+        cur = self._connection.get().cursor()
+        self._validate_entry_cache(cur)
+        result = {
+            commit_id: copy.copy(self._entry_cache[commit_id])
+            for commit_id in commit_ids
+            if commit_id in self._entry_cache
+        }
+        missing_commit_ids = [commit_id for commit_id in commit_ids if commit_id not in result]
+        if not missing_commit_ids:
+            return result
+        cur.execute(_select_many_sql(COMMIT_ENTRY_TABLE, len(missing_commit_ids)), missing_commit_ids)
+        loaded = {key: serialization.loads(data) for key, data in cur.fetchall()}
+        self._join_raw_nbs(cur, list(loaded.values()))
+        for commit_id, commit_entry in loaded.items():
+            self._cache_entry(commit_entry)
+            result[commit_id] = copy.copy(commit_entry)
         return result
 
+    def _encode_commit_entry(self, cur: sqlite3.Cursor, commit_entry: CommitEntry) -> bytes:
+        """
+        Serializes the commit entry without its raw notebook, which is stored in the raw notebook
+        table unless a notebook with the same content is already there.
+        """
+        if commit_entry.raw_nb is None:
+            return serialization.compress(serialization.dumps(commit_entry), COMPRESSION_LEVEL)
+        if commit_entry.raw_nb is self._last_raw_nb:
+            raw_nb_hash = self._last_raw_nb_hash
+        else:
+            raw_nb_hash = hashlib.blake2b(commit_entry.raw_nb.encode("utf-8"), digest_size=16).hexdigest()
+        cur.execute(SELECT_RAW_NB_EXISTS_SQL, (raw_nb_hash,))
+        if cur.fetchone() is None:
+            raw_nb_data = serialization.compress(serialization.dumps(commit_entry.raw_nb), COMPRESSION_LEVEL)
+            cur.execute(INSERT_RAW_NB_SQL, (raw_nb_hash, raw_nb_data))
+        self._last_raw_nb, self._last_raw_nb_hash = commit_entry.raw_nb, raw_nb_hash
+        stored_entry = dataclasses.replace(commit_entry, raw_nb=None, raw_nb_hash=raw_nb_hash)
+        return serialization.compress(serialization.dumps(stored_entry), COMPRESSION_LEVEL)
+
+    @staticmethod
+    def _join_raw_nbs(cur: sqlite3.Cursor, commit_entries: List[CommitEntry]) -> None:
+        """
+        Fills in the raw notebooks of commit entries stored with only their hash.
+        """
+        raw_nb_hashes = list({
+            commit_entry.raw_nb_hash
+            for commit_entry in commit_entries
+            if commit_entry.raw_nb is None and commit_entry.raw_nb_hash is not None
+        })
+        if not raw_nb_hashes:
+            return
+        cur.execute(_select_raw_nbs_sql(len(raw_nb_hashes)), raw_nb_hashes)
+        raw_nbs = {raw_nb_hash: serialization.loads(content) for raw_nb_hash, content in cur.fetchall()}
+        for commit_entry in commit_entries:
+            if commit_entry.raw_nb is None and commit_entry.raw_nb_hash is not None:
+                commit_entry.raw_nb = raw_nbs.get(commit_entry.raw_nb_hash)
+
+    def _validate_entry_cache(self, cur: sqlite3.Cursor) -> None:
+        """
+        Drops cached entries if another connection (e.g., kishu edit in another process) committed
+        to the database since they were read. The data version ignores this connection's own writes,
+        which update_commit evicts itself.
+        """
+        cur.execute("PRAGMA data_version")
+        version = (cur.connection, cur.fetchone()[0])
+        if version != self._entry_cache_version:
+            self._entry_cache.clear()
+            self._entry_cache_version = version
+
+    def _cache_entry(self, commit_entry: CommitEntry) -> None:
+        self._entry_cache[commit_entry.commit_id] = commit_entry
+        self._entry_cache.move_to_end(commit_entry.commit_id)
+        while len(self._entry_cache) > KishuCommit.ENTRY_CACHE_SIZE:
+            self._entry_cache.popitem(last=False)
+
+    @staticmethod
+    def _encode_session_state(active_vses_string: Optional[str]) -> Optional[bytes]:
+        # Session states are plain strings, so they are stored as UTF-8 without pickling.
+        return None if active_vses_string is None else active_vses_string.encode("utf-8")
+
+    @staticmethod
+    def _decode_session_state(data: Optional[bytes]) -> Optional[str]:
+        if data is None:
+            return None
+        # UTF-8 never starts with a continuation byte such as 0x80, the first byte of pickled
+        # session states stored by older versions.
+        if data[:1] == b"\x80":
+            return serialization.loads(data)
+        return bytes(data).decode("utf-8")
+
     def get_commit_table_size(self) -> int:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         cur.execute(
             f"SELECT SUM('pgsize') FROM 'dbstat' WHERE name='{COMMIT_ENTRY_TABLE}'"
         )
@@ -186,16 +359,20 @@ class KishuCommit:
         if not res:
             raise MissingCommitEntryError(commit_id)
         result = int(res[0])
-        con.commit()
         return result
 
     def keys_like(self, commit_id_like: str) -> List[str]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
-        cur.execute(
-            f"select commit_id from {COMMIT_ENTRY_TABLE} where commit_id LIKE ?",
-            (commit_id_like + "%", )
-        )
+        """
+        Returns the commit IDs starting with the given prefix, using a range scan on the primary key.
+        """
+        cur = self._connection.get().cursor()
+        if commit_id_like:
+            upper_bound = commit_id_like[:-1] + chr(ord(commit_id_like[-1]) + 1)
+            cur.execute(
+                f"select commit_id from {COMMIT_ENTRY_TABLE} where commit_id >= ? and commit_id < ?",
+                (commit_id_like, upper_bound)
+            )
+        else:
+            cur.execute(f"select commit_id from {COMMIT_ENTRY_TABLE}")
         result = [commit_id for (commit_id,) in cur.fetchall()]
-        con.commit()
         return result
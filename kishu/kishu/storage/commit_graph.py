@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 import json
+import mmap
+import numpy as np
 import os
 import pickle
+import struct
 
+from array import array
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, Iterator, List, Literal, Optional, Set, Tuple, Union
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple, Union
 from typing_extensions import TypeAlias
 
 from kishu.storage.config import Config
@@ -24,9 +29,22 @@ MUL_SIZE times larger than its lower rank block (exponential sizes).
 MAX_BASE_SIZE = Config.get('COMMIT_GRAPH', 'MAX_BASE_SIZE', 128)
 MUL_SIZE = Config.get('COMMIT_GRAPH', 'MUL_SIZE', 2)
 
+"""
+Number of inserted nodes buffered in memory before they are written to the tail block file. Buffered
+nodes are also written by KishuCommitGraph.flush, jump, and when the graph is garbage collected.
+"""
+WRITE_BATCH_SIZE = Config.get('COMMIT_GRAPH', 'WRITE_BATCH_SIZE', 64)
+
+"""
+Number of per-commit histories memoized by KishuCommitGraph.list_history.
+"""
+HISTORY_CACHE_SIZE = Config.get('COMMIT_GRAPH', 'HISTORY_CACHE_SIZE', 32)
+
 """
 Node byte format: [ header | serialzied node | padding ] where header contains the serialized node
 size in bytes. Header is an integer encoded in little endian. This assumes each node fits in 200 B.
+Nodes are now written as fixed records (see NODE_RECORD) whose header is zero; pickled nodes with
+the format above are still read.
 """
 NODE_SIZE = Config.get('COMMIT_GRAPH', 'NODE_SIZE', 256)  # bytes
 NODE_HEADER_SIZE = Config.get('COMMIT_GRAPH', 'NODE_HEADER_SIZE', 1)  # bytes
@@ -38,7 +56,18 @@ assert 2 ** (8 * NODE_HEADER_SIZE) >= NODE_DATA_SIZE
 Useful constants.
 """
 ABSOLUTE_PAST: CommitId = ""  # Logically first commit (e.g., commit graph's root).
-UNSET_POSITION = (-99, -99)  # Position of a node that has not been persisted.
+UNSET_RANK = -99
+UNSET_POSITION = (UNSET_RANK, UNSET_RANK)  # Position of a node that has not been persisted.
+
+"""
+Fixed node record: [ zero header | int32 rank, offset | int32 parent rank, parent offset |
+commit ID | parent ID | padding ], little endian. IDs are UTF-8 encoded and NUL padded.
+"""
+NODE_ID_SIZE = (NODE_DATA_SIZE - 16) // 2  # Max bytes of UTF-8 encoded commit IDs in a node.
+NODE_RECORD = struct.Struct(
+    f"<{NODE_HEADER_SIZE}x4i{NODE_ID_SIZE}s{NODE_ID_SIZE}s{NODE_DATA_SIZE - 16 - 2 * NODE_ID_SIZE}x"
+)
+assert NODE_RECORD.size == NODE_SIZE
 
 
 def MAX_BLOCK_SIZE(rank):
@@ -47,9 +76,18 @@ def MAX_BLOCK_SIZE(rank):
 
 @dataclass
 class CommitNodeInfo:
+    __slots__ = ("commit_id", "parent_id")
     commit_id: CommitId
     parent_id: CommitId
 
+    # Pickle as a dict of fields, the format written before nodes had slots.
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"commit_id": self.commit_id, "parent_id": self.parent_id}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.commit_id = state["commit_id"]
+        self.parent_id = state["parent_id"]
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, CommitNodeInfo):
             return False
@@ -58,6 +96,10 @@ class CommitNodeInfo:
             self.parent_id == other.parent_id
         )
 
+    # Treated as immutable, e.g., as keys of caches and sets of histories.
+    def __hash__(self) -> int:
+        return hash((self.commit_id, self.parent_id))
+
     def __repr__(self) -> str:
         return f"CommitNodeInfo(\"{self.commit_id}\", \"{self.parent_id}\")"
 
@@ -66,11 +108,30 @@ class CommitNodeInfo:
 
 
 class CommitNode:
+    __slots__ = ("_info", "_rank", "_offset", "_parent_rank", "_parent_offset", "_id_bytes")
 
     def __init__(self, commit_node_info: CommitNodeInfo):
         self._info = commit_node_info
-        self._position = UNSET_POSITION
-        self._parent_position = UNSET_POSITION
+        self._rank, self._offset = UNSET_POSITION
+        self._parent_rank, self._parent_offset = UNSET_POSITION
+
+        # Encoded (commit ID, parent ID) as read from a record, reused when the node is written
+        # again, e.g., when merging blocks.
+        self._id_bytes: Optional[Tuple[bytes, bytes]] = None
+
+    # Pickle as a dict of fields, the format written before nodes had slots.
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "_info": self._info,
+            "_position": self.position(),
+            "_parent_position": self.parent_position(),
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._info = state["_info"]
+        self._rank, self._offset = state["_position"]
+        self._parent_rank, self._parent_offset = state["_parent_position"]
+        self._id_bytes = None
 
     def commit_id(self) -> CommitId:
         return self._info.commit_id
@@ -82,49 +143,98 @@ class CommitNode:
         return self._info
 
     def position(self) -> BlockPosition:
-        return self._position
+        return self._rank, self._offset
 
     def parent_position(self) -> BlockPosition:
-        return self._parent_position
+        return self._parent_rank, self._parent_offset
+
+    def has_parent_position(self) -> bool:
+        return self._parent_rank != UNSET_RANK
 
     def set_position(self, position: BlockPosition) -> None:
-        self._position = position
+        self._rank, self._offset = position
 
     def set_parent_position(self, position: BlockPosition) -> None:
-        self._parent_position = position
+        self._parent_rank, self._parent_offset = position
 
     def serialize(self) -> bytes:
-        self_bytes = pickle.dumps(self)
-        self_bytes_len = len(self_bytes)
-        if self_bytes_len > NODE_DATA_SIZE:
-            raise ValueError(
-                f"CommitNode {self.info()} is too large ({self_bytes_len} > {NODE_DATA_SIZE})"
-            )
-        header = self_bytes_len.to_bytes(NODE_HEADER_SIZE, NODE_HEADER_BYTEORDER)
-        padding = bytes(NODE_DATA_SIZE - self_bytes_len)
-        return header + self_bytes + padding
+        if self._id_bytes is not None:
+            commit_id_bytes, parent_id_bytes = self._id_bytes
+        else:
+            commit_id_bytes = self._info.commit_id.encode()
+            parent_id_bytes = self._info.parent_id.encode()
+            id_bytes_len = max(len(commit_id_bytes), len(parent_id_bytes))
+            if id_bytes_len > NODE_ID_SIZE:
+                raise ValueError(
+                    f"CommitNode {self.info()} is too large ({id_bytes_len} > {NODE_ID_SIZE})"
+                )
+        return NODE_RECORD.pack(
+            self._rank, self._offset, self._parent_rank, self._parent_offset, commit_id_bytes, parent_id_bytes
+        )
 
     @staticmethod
     def deserialize(buffer: bytes) -> CommitNode:
         self_bytes_len = int.from_bytes(buffer[:NODE_HEADER_SIZE], NODE_HEADER_BYTEORDER)
-        self_bytes = buffer[NODE_HEADER_SIZE:NODE_HEADER_SIZE + self_bytes_len]
-        return pickle.loads(self_bytes)
+        if self_bytes_len > 0:
+            # Pickled by an older version.
+            self_bytes = buffer[NODE_HEADER_SIZE:NODE_HEADER_SIZE + self_bytes_len]
+            return pickle.loads(self_bytes)
+
+        rank, offset, parent_rank, parent_offset, commit_id_bytes, parent_id_bytes = NODE_RECORD.unpack(buffer)
+        commit_id = commit_id_bytes.rstrip(b"\0").decode()
+        parent_id = parent_id_bytes.rstrip(b"\0").decode()
+        node = CommitNode(CommitNodeInfo(commit_id, parent_id))
+        node._rank, node._offset = rank, offset
+        node._parent_rank, node._parent_offset = parent_rank, parent_offset
+        node._id_bytes = commit_id_bytes, parent_id_bytes
+        return node
 
 
 class CommitNodeInfoIterator(Iterator[CommitNodeInfo]):
     pass
 
 
+class NodeFileMap:
+    """
+    Read-only memory map of a node file, so that random reads need no syscalls. Remapped when
+    reading past the mapped end since the file may have grown.
+    """
+
+    def __init__(self) -> None:
+        self._mmap: Optional[mmap.mmap] = None
+        self._num_nodes = 0
+
+    def read(self, file_path: str, offset: int) -> CommitNode:
+        if self._mmap is None or offset >= self._num_nodes:
+            self.close()
+            with open(file_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._num_nodes = len(self._mmap) // NODE_SIZE
+        start = NODE_SIZE * offset
+        return CommitNode.deserialize(self._mmap[start:start + NODE_SIZE])
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+            self._num_nodes = 0
+
+
 class CommitGraphBlockTail:
 
     def __init__(self, root_path):
         # Create new empty block.
         self._root_path = root_path
-        self._size = 0
+        self._size = 0  # Including pending nodes.
+
+        # Inserted nodes not yet written to the file, oldest first, and their bytes.
+        self._pending: List[CommitNode] = []
+        self._pending_bytes: List[bytes] = []
+        self._map = NodeFileMap()
 
     def to_dict(self) -> Dict[str, Any]:
         return {
-            "size": self._size,
+            "size": self._flushed_size(),
         }
 
     @staticmethod
@@ -139,46 +249,70 @@ class CommitGraphBlockTail:
     def read(self, position: BlockPosition) -> CommitNode:
         rank, offset = position
         assert rank == -1
-        with open(self._file_path(), "rb") as f:
-            f.seek(NODE_SIZE * offset)
-            node_bytes = f.read(NODE_SIZE)
-        return CommitNode.deserialize(node_bytes)
+        if offset >= self._flushed_size():
+            return self._pending[offset - self._flushed_size()]
+        return self._map.read(self._file_path(), offset)
 
     def read_all(self) -> List[CommitNode]:
         try:
-            with open(self._file_path(), "rb") as f:
-                nodes = [CommitNode.deserialize(f.read(NODE_SIZE)) for idx in range(self._size)]
-            return nodes
+            file_path = self._file_path()
+            nodes = [self._map.read(file_path, idx) for idx in range(self._flushed_size())]
         except FileNotFoundError:
-            return []
+            nodes = []
+        nodes.extend(self._pending)
+        return nodes
 
     def find_and_read(self, commit_id: CommitId) -> Optional[CommitNode]:
         # Linear search.
         try:
-            with open(self._file_path(), "rb") as f:
-                for idx in range(self._size):
-                    node = CommitNode.deserialize(f.read(NODE_SIZE))
-                    if node.commit_id() == commit_id:
-                        return node
+            file_path = self._file_path()
+            for idx in range(self._flushed_size()):
+                node = self._map.read(file_path, idx)
+                if node.commit_id() == commit_id:
+                    return node
         except FileNotFoundError:
             pass
+        for node in self._pending:
+            if node.commit_id() == commit_id:
+                return node
         return None
 
     def insert(self, node: CommitNode) -> None:
         node.set_position((-1, self._size))
-        with open(self._file_path(), "a+b") as f:
-            node_bytes = node.serialize()
-            assert len(node_bytes) == NODE_SIZE, f"{len(node_bytes)} != {NODE_SIZE}"
-            f.write(node_bytes)
+        # Serialize now so that invalid nodes (e.g., too large) are rejected before being queued.
+        node_bytes = node.serialize()
+        assert len(node_bytes) == NODE_SIZE, f"{len(node_bytes)} != {NODE_SIZE}"
+        self._pending.append(node)
+        self._pending_bytes.append(node_bytes)
         self._size += 1
 
+    def num_pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> None:
+        """
+        Appends pending nodes to the file with a single write.
+        """
+        if not self._pending:
+            return
+        with open(self._file_path(), "a+b") as f:
+            f.write(b"".join(self._pending_bytes))
+        self._pending.clear()
+        self._pending_bytes.clear()
+
     def clear(self) -> None:
         self._size = 0
+        self._pending.clear()
+        self._pending_bytes.clear()
+        self._map.close()
         try:
             os.remove(self._file_path())
         except FileNotFoundError:
             pass
 
+    def _flushed_size(self) -> int:
+        return self._size - len(self._pending)
+
     def _file_path(self) -> str:
         return os.path.join(self._root_path, "commit_block_tail")
 
@@ -191,6 +325,7 @@ class CommitGraphBlockSorted:
         self._rank = rank
         self._gen = 0  # Increment when merge.
         self._size = 0
+        self._map = NodeFileMap()
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -212,39 +347,40 @@ class CommitGraphBlockSorted:
     def read(self, position: BlockPosition) -> CommitNode:
         rank, offset = position
         assert rank == self._rank
-        with open(self._file_path(), "rb") as f:
-            f.seek(NODE_SIZE * offset)
-            node_bytes = f.read(NODE_SIZE)
-        return CommitNode.deserialize(node_bytes)
+        return self._map.read(self._file_path(), offset)
 
     def read_all(self) -> List[CommitNode]:
         try:
-            with open(self._file_path(), "rb") as f:
-                nodes = [CommitNode.deserialize(f.read(NODE_SIZE)) for idx in range(self._size)]
-            return nodes
+            file_path = self._file_path()
+            return [self._map.read(file_path, idx) for idx in range(self._size)]
         except FileNotFoundError:
             return []
 
     def find_and_read(self, commit_id: CommitId) -> Optional[CommitNode]:
         # TODO: binary search.
         try:
-            with open(self._file_path(), "rb") as f:
-                for idx in range(self._size):
-                    node = CommitNode.deserialize(f.read(NODE_SIZE))
-                    if node.commit_id() == commit_id:
-                        return node
+            file_path = self._file_path()
+            for idx in range(self._size):
+                node = self._map.read(file_path, idx)
+                if node.commit_id() == commit_id:
+                    return node
         except FileNotFoundError:
             pass
         return None
 
     def merge(self, other: CommitGraphBlockSorted) -> CommitGraphBlockSorted:
         # TODO: merge sort?
-        return self.merge_with_nodes(other.read_all(), other._rank)
+        return self.merge_with_nodes(other.read_all(), other._rank)[0]
 
     def merge_tail(self, other: CommitGraphBlockTail) -> CommitGraphBlockSorted:
-        return self.merge_with_nodes(other.read_all(), -1)
+        return self.merge_with_nodes(other.read_all(), -1)[0]
 
-    def merge_with_nodes(self, other_nodes: List[CommitNode], other_rank: int) -> CommitGraphBlockSorted:
+    def merge_with_nodes(
+        self, other_nodes: List[CommitNode], other_rank: int
+    ) -> Tuple[CommitGraphBlockSorted, List[CommitNode]]:
+        """
+        Returns the merged block and its nodes, so that callers need not read them back.
+        """
         # Read all nodes from both sides.
         nodes = self.read_all()
         nodes.extend(other_nodes)
@@ -276,10 +412,11 @@ class CommitGraphBlockSorted:
                 assert len(node_bytes) == NODE_SIZE, f"{len(node_bytes)} != {NODE_SIZE}"
                 f.write(node_bytes)
 
-        return new_block
+        return new_block, nodes
 
     def clear(self) -> None:
         self._size = 0
+        self._map.close()
         try:
             os.remove(self._file_path())
         except FileNotFoundError:
@@ -301,14 +438,71 @@ class CommitGraphWalker(CommitNodeInfoIterator):
         if self._current_node is None:
             raise StopIteration
         current_node = self._current_node
-        next_position = self._current_node.parent_position()
-        if next_position == UNSET_POSITION:
-            self._current_node = None
+        if current_node.has_parent_position():
+            self._current_node = self._store._read(current_node.parent_position())
         else:
-            self._current_node = self._store._read(next_position)
+            self._current_node = None
         return current_node.info()
 
 
+class CommitIdIndex:
+    """
+    Open-addressing hash table (linear probing) from commit IDs to block positions. Keys are 64-bit
+    hashes of the IDs and values are packed positions, both in numpy arrays, so the index holds no
+    per-commit Python objects. Distinct IDs may share a hash, so callers verify the node read at a
+    returned position.
+    """
+    INITIAL_CAPACITY = 1024  # Power of two.
+    MAX_LOAD_FACTOR = 0.7
+    EMPTY_KEY = 0
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        self._keys = np.zeros(capacity, dtype=np.uint64)
+        self._values = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+
+    def get(self, commit_id: CommitId) -> Optional[BlockPosition]:
+        slot = self._find_slot(CommitIdIndex._key(commit_id))
+        if self._keys[slot] == CommitIdIndex.EMPTY_KEY:
+            return None
+        value = int(self._values[slot])
+        return (value >> 32) - 1, value & 0xFFFFFFFF
+
+    def set(self, commit_id: CommitId, position: BlockPosition) -> None:
+        if self._size + 1 > CommitIdIndex.MAX_LOAD_FACTOR * len(self._keys):
+            self._grow()
+        key = CommitIdIndex._key(commit_id)
+        slot = self._find_slot(key)
+        if self._keys[slot] == CommitIdIndex.EMPTY_KEY:
+            self._keys[slot] = key
+            self._size += 1
+        rank, offset = position
+        self._values[slot] = ((rank + 1) << 32) | offset
+
+    def _find_slot(self, key: int) -> int:
+        # Slot holding the key, or the empty slot where it would be inserted.
+        mask = len(self._keys) - 1
+        slot = key & mask
+        while self._keys[slot] != CommitIdIndex.EMPTY_KEY and self._keys[slot] != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self) -> None:
+        keys, values = self._keys, self._values
+        self._keys = np.zeros(2 * len(keys), dtype=np.uint64)
+        self._values = np.zeros(2 * len(values), dtype=np.int64)
+        for key, value in zip(keys.tolist(), values.tolist()):
+            if key != CommitIdIndex.EMPTY_KEY:
+                slot = self._find_slot(key)
+                self._keys[slot] = key
+                self._values[slot] = value
+
+    @staticmethod
+    def _key(commit_id: CommitId) -> int:
+        key = hash(commit_id) & 0xFFFFFFFFFFFFFFFF
+        return key if key != CommitIdIndex.EMPTY_KEY else 1
+
+
 class CommitGraphStore:
 
     def __init__(self, root_path: str):
@@ -316,21 +510,49 @@ class CommitGraphStore:
         self._sorted_blocks: List[CommitGraphBlockSorted] = []
         self._tail_block: CommitGraphBlockTail = CommitGraphBlockTail(self._root_path)
 
+        # Head set since the last flush, if any.
+        self._pending_head: Optional[CommitId] = None
+
+        # Position of each commit, built on first insertion. Stores that only read (e.g., kishu log)
+        # look up few commits, for which scanning the blocks is cheaper than building the index.
+        self._index: Optional[CommitIdIndex] = None
+
         try:
             self._load_meta()
         except FileNotFoundError:
             pass
 
+    def __del__(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            # The root directory may be gone, or the interpreter may be shutting down.
+            pass
+
     def begin_read(self, commit_id: CommitId) -> CommitNodeInfoIterator:
         return CommitGraphWalker(self, self._find_and_read(commit_id))
 
+    def history_depth(self, commit_id: CommitId) -> int:
+        depth = 0
+        node = self._find_and_read(commit_id)
+        while node is not None:
+            depth += 1
+            node = self._read(node.parent_position()) if node.has_parent_position() else None
+        return depth
+
     def read_all(self) -> List[CommitNodeInfo]:
         commit_node_infos = [node.info() for node in self._tail_block.read_all()]
         for sorted_block in self._sorted_blocks:
             commit_node_infos.extend([node.info() for node in sorted_block.read_all()])
         return commit_node_infos
 
+    def contains(self, commit_id: CommitId) -> bool:
+        # Only writers check for commits, so build the index as insertions do.
+        self._build_index()
+        return self._find_and_read(commit_id) is not None
+
     def insert(self, commit_node_info: CommitNodeInfo):
+        self._build_index()
         node = CommitNode(commit_node_info)
         parent_node = self._find_and_read(node.parent_id())
         if parent_node is not None:
@@ -338,12 +560,19 @@ class CommitGraphStore:
         self._insert(node)
 
     def set_head(self, commit_id: CommitId):
-        with open(self._head_path(), "w") as f:
-            meta = {}
-            meta["commit_id"] = commit_id
-            json.dump(meta, f)
+        self._pending_head = commit_id
 
     def get_head(self) -> CommitId:
+        if self._pending_head is not None:
+            return self._pending_head
+        try:
+            with open(self._meta_path(), "r") as f:
+                meta = json.load(f)
+            if "head" in meta:
+                return meta["head"]
+        except FileNotFoundError:
+            pass
+        # Graphs written before the head moved into the metadata.
         try:
             with open(self._head_path(), "r") as f:
                 meta = json.load(f)
@@ -351,6 +580,16 @@ class CommitGraphStore:
         except FileNotFoundError:
             return ABSOLUTE_PAST
 
+    def flush(self) -> None:
+        """
+        Writes pending nodes, then metadata including the head.
+        """
+        if self._tail_block.num_pending() == 0 and self._pending_head is None:
+            return
+        self._tail_block.flush()
+        self._save_meta()
+        self._pending_head = None
+
     """
     Commit graph chain: management over collection of blocks.
     """
@@ -368,10 +607,22 @@ class CommitGraphStore:
         return self._sorted_blocks[rank].read(position)
 
     def _find_and_read(self, commit_id: CommitId) -> Optional[CommitNode]:
-        # Find in tail first, then lower-rank to higher-rank sorted blocks.
-        # Assuming most commit_id is skewed towards newer commits.
         if commit_id == ABSOLUTE_PAST:
             return None
+        if self._index is None:
+            return self._scan_and_read(commit_id)
+        position = self._index.get(commit_id)
+        if position is None:
+            return None
+        node = self._read(position)
+        if node.commit_id() == commit_id:
+            return node
+        # Hash collision with another commit.
+        return self._scan_and_read(commit_id)
+
+    def _scan_and_read(self, commit_id: CommitId) -> Optional[CommitNode]:
+        # Find in tail first, then lower-rank to higher-rank sorted blocks.
+        # Assuming most commit_id is skewed towards newer commits.
         node = self._tail_block.find_and_read(commit_id)
         if node is not None:
             return node
@@ -381,17 +632,35 @@ class CommitGraphStore:
                 return node
         return None
 
+    def _build_index(self) -> None:
+        if self._index is None:
+            # Index in reverse lookup order so that the first node found by _scan_and_read wins.
+            self._index = CommitIdIndex()
+            for sorted_block in reversed(self._sorted_blocks):
+                self._index_nodes(sorted_block.read_all())
+            self._index_nodes(self._tail_block.read_all())
+
+    def _index_nodes(self, nodes: List[CommitNode]) -> None:
+        assert self._index is not None
+        for node in reversed(nodes):
+            self._index.set(node.commit_id(), node.position())
+
     def _insert(self, node: CommitNode) -> None:
         self._tail_block.insert(node)
+        if self._index is not None:
+            # An older node of the same commit in the tail is found first.
+            position = self._index.get(node.commit_id())
+            if position is None or position[0] != -1:
+                self._index.set(node.commit_id(), node.position())
         if self._tail_block.size() >= MAX_BLOCK_SIZE(-1):
             # Tail block is full; merging into the first sorted block.
-            new_sorted_block = self._get_sorted_block(0).merge_tail(self._tail_block)
+            new_sorted_block, nodes = self._get_sorted_block(0).merge_with_nodes(self._tail_block.read_all(), -1)
 
             # Merge until size is under capacity by rank.
             rank = 0
             while new_sorted_block.size() >= MAX_BLOCK_SIZE(rank):
                 rank += 1
-                next_sorted_block = self._get_sorted_block(rank).merge(new_sorted_block)
+                next_sorted_block, nodes = self._get_sorted_block(rank).merge_with_nodes(nodes, rank - 1)
                 new_sorted_block.clear()
                 new_sorted_block = next_sorted_block
 
@@ -404,9 +673,13 @@ class CommitGraphStore:
 
             # Assign new sorted block.
             self._sorted_blocks[rank] = new_sorted_block
+            if self._index is not None:
+                self._index_nodes(nodes)
 
-        # Update metadata.
-        self._save_meta()
+            # Update metadata.
+            self._save_meta()
+        elif self._tail_block.num_pending() >= WRITE_BATCH_SIZE:
+            self.flush()
 
     def _get_sorted_block(self, rank):
         while rank >= len(self._sorted_blocks):
@@ -414,12 +687,14 @@ class CommitGraphStore:
         return self._sorted_blocks[rank]
 
     def _save_meta(self):
+        head_commit_id = self.get_head()
         with open(self._meta_path(), "w") as f:
             meta = {}
             meta["sorted_blocks"] = [
                 sorted_block.to_dict() for sorted_block in self._sorted_blocks
             ]
             meta["tail_block"] = self._tail_block.to_dict()
+            meta["head"] = head_commit_id
             json.dump(meta, f)
 
     def _load_meta(self):
@@ -444,55 +719,89 @@ class InMemoryCommitGraphWalker(CommitNodeInfoIterator):
 
     def __init__(self, graph: InMemoryCommitGraphStore, commit_id: CommitId):
         super().__init__()
-        self._graph = graph
-        self._commit_id_queue: Set[CommitId] = set()
-        self._visited_id: Set[CommitId] = set()
-        if commit_id in self._graph._infos:
-            self._commit_id_queue.add(commit_id)
+        # Columns are only appended to, so they can be referenced directly for fewer lookups per hop.
+        self._commit_ids = graph._commit_ids
+        self._parent_ids = graph._parent_ids
+        self._parent_rows = graph._parent_rows
+        self._row = graph._rows.get(commit_id, -1)
 
     def __iter__(self) -> CommitNodeInfoIterator:
         return self
 
     def __next__(self) -> CommitNodeInfo:
-        if len(self._commit_id_queue) == 0:
+        row = self._row
+        if row < 0:
             raise StopIteration
-        current_commit_id = self._commit_id_queue.pop()
-        for commit_id in self._graph._edge_lists[current_commit_id]:
-            if commit_id in self._graph._infos and commit_id not in self._visited_id:
-                self._commit_id_queue.add(commit_id)
-                self._visited_id.add(commit_id)
-        return self._graph._infos[current_commit_id]
+        self._row = self._parent_rows[row]
+        return CommitNodeInfo(self._commit_ids[row], self._parent_ids[row])
 
 
 class InMemoryCommitGraphStore:
+    """
+    Keeps nodes column-wise, one list per field indexed by row, instead of an object per node.
+    Re-inserting a commit adds a row that supersedes the earlier one.
+
+    Parents are resolved to rows on insertion, so walks follow integers rather than looking up
+    commit IDs. A parent's row always precedes its child's, so walks cannot cycle.
+    """
 
     def __init__(self) -> None:
-        self._edge_lists: Dict[CommitId, List[CommitId]] = {}
-        self._infos: Dict[CommitId, CommitNodeInfo] = {}
+        self._commit_ids: List[CommitId] = []
+        self._parent_ids: List[CommitId] = []
+        self._parent_rows = array("i")  # -1 if the parent is not in the graph.
+        self._rows: Dict[CommitId, int] = {}  # Latest row of each commit.
         self._head_commit_id: CommitId = ABSOLUTE_PAST
 
     def begin_read(self, commit_id: CommitId) -> CommitNodeInfoIterator:
         return InMemoryCommitGraphWalker(self, commit_id)
 
     def read_all(self) -> List[CommitNodeInfo]:
-        return [v for _, v in self._infos.items()]
+        return [self._info(row) for row in self._rows.values()]
+
+    def contains(self, commit_id: CommitId) -> bool:
+        return commit_id in self._rows
+
+    def history_depth(self, commit_id: CommitId) -> int:
+        depth = 0
+        row = self._rows.get(commit_id, -1)
+        parent_rows = self._parent_rows
+        while row >= 0:
+            depth += 1
+            row = parent_rows[row]
+        return depth
 
     def insert(self, commit_node_info: CommitNodeInfo):
-        self._edge_lists.setdefault(commit_node_info.commit_id, []).append(commit_node_info.parent_id)
-        self._infos[commit_node_info.commit_id] = commit_node_info
+        self._parent_rows.append(self._rows.get(commit_node_info.parent_id, -1))
+        self._rows[commit_node_info.commit_id] = len(self._commit_ids)
+        self._commit_ids.append(commit_node_info.commit_id)
+        self._parent_ids.append(commit_node_info.parent_id)
 
     def set_head(self, commit_id: CommitId):
         self._head_commit_id = commit_id
 
+    def flush(self) -> None:
+        pass
+
     def get_head(self) -> CommitId:
         return self._head_commit_id
 
+    def _info(self, row: int) -> CommitNodeInfo:
+        return CommitNodeInfo(self._commit_ids[row], self._parent_ids[row])
+
 
 class KishuCommitGraph:
 
     def __init__(self, store: Union[InMemoryCommitGraphStore, CommitGraphStore]):
         self._store = store
 
+        # History of the head from oldest to newest, extended by step().
+        self._head_history: Optional[List[CommitNodeInfo]] = None
+        self._head_history_id: Optional[CommitId] = None
+        self._head_history_index: Dict[CommitId, int] = {}
+
+        # Histories of other commits, which never change once the commit exists.
+        self._history_cache: OrderedDict[CommitId, List[CommitNodeInfo]] = OrderedDict()
+
     @staticmethod
     def new_in_memory() -> KishuCommitGraph:
         return KishuCommitGraph(InMemoryCommitGraphStore())
@@ -513,7 +822,67 @@ class KishuCommitGraph:
         """
         Lists past commit(s) leading to the given commit.
         """
-        return list(self.iter_history(commit_id))
+        head_commit_id = self._store.get_head()
+        if commit_id is None or commit_id == head_commit_id:
+            if self._head_history is None or self._head_history_id != head_commit_id:
+                head_history = self._walk_history(head_commit_id)[::-1]
+                self._head_history = head_history
+                self._head_history_id = head_commit_id
+                self._head_history_index = {node.commit_id: i for i, node in enumerate(head_history)}
+            return self._head_history[::-1]
+
+        history = self._history_cache.get(commit_id)
+        if history is None:
+            history = self._walk_history(commit_id)
+            if not history:
+                # The commit may be created later.
+                return history
+            self._history_cache[commit_id] = history
+            if len(self._history_cache) > HISTORY_CACHE_SIZE:
+                self._history_cache.popitem(last=False)
+        else:
+            self._history_cache.move_to_end(commit_id)
+        return list(history)
+
+    def history_depth(self, commit_id: Optional[CommitId] = None) -> int:
+        """
+        Counts past commit(s) leading to the given commit, i.e., len(list_history(commit_id)),
+        without listing them.
+        """
+        if commit_id is None:
+            commit_id = self._store.get_head()
+        if self._head_history is not None:
+            position = self._head_history_index.get(commit_id)
+            if position is not None:
+                return position + 1
+        history = self._history_cache.get(commit_id)
+        if history is not None:
+            return len(history)
+        return self._store.history_depth(commit_id)
+
+    def _walk_history(self, commit_id: CommitId) -> List[CommitNodeInfo]:
+        """
+        Walks the graph from the commit until reaching an ancestor whose history is already known,
+        i.e., one in the head history or the history cache, and reuses that ancestor's history.
+        """
+        history: List[CommitNodeInfo] = []
+        for commit_node_info in self.iter_history(commit_id):
+            known_history = self._known_history(commit_node_info.commit_id)
+            if known_history is not None:
+                history.extend(known_history)
+                break
+            history.append(commit_node_info)
+        return history
+
+    def _known_history(self, commit_id: CommitId) -> Optional[List[CommitNodeInfo]]:
+        """
+        Returns the history of the commit (newest first) if it is cached, else None.
+        """
+        if self._head_history is not None:
+            position = self._head_history_index.get(commit_id)
+            if position is not None:
+                return self._head_history[position::-1]
+        return self._history_cache.get(commit_id)
 
     def get_common_ancestor(self, commit_id1: CommitId, commit_id2: CommitId) -> Optional[CommitId]:
         """
@@ -554,19 +923,34 @@ class KishuCommitGraph:
         Steps forward to the commit, associating the current commit as its past.
         """
         head_commit_id = self._store.get_head()
-        self._store.insert(CommitNodeInfo(commit_id, head_commit_id))
+        commit_node_info = CommitNodeInfo(commit_id, head_commit_id)
+        self._store.insert(commit_node_info)
         self._store.set_head(commit_id)
 
+        # Extend the cached head history instead of walking the graph again.
+        if self._head_history is not None and self._head_history_id == head_commit_id:
+            self._head_history_index[commit_id] = len(self._head_history)
+            self._head_history.append(commit_node_info)
+            self._head_history_id = commit_id
+        else:
+            self._head_history = None
+
     def jump(self, commit_id: CommitId) -> None:
         """
         Jumps to the given commit without associating the current commit.
 
         Associate with ABSOLUTE_PAST if the commit not exist before (first time seeing).
         """
-        commit_node_info = next(self._store.begin_read(commit_id), None)
-        if commit_node_info is None:
+        if not self._store.contains(commit_id):
             self._store.insert(CommitNodeInfo(commit_id, ABSOLUTE_PAST))
         self._store.set_head(commit_id)
+        self._store.flush()
+
+    def flush(self) -> None:
+        """
+        Persists steps buffered in memory, e.g., before other processes read the graph.
+        """
+        self._store.flush()
 
 
 """
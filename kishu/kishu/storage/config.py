@@ -13,7 +13,9 @@ class Config:
     last_read_time = -1.0
 
     # Default config categories.
-    DEFAULT_CATEGORIES = ['CLI', 'COMMIT_GRAPH', 'EXPERIMENT', 'JUPYTERINT', 'OPTIMIZER', 'PLANNER', 'PROFILER']
+    DEFAULT_CATEGORIES = [
+        'CLI', 'COMMIT', 'COMMIT_GRAPH', 'EXPERIMENT', 'JUPYTERINT', 'OPTIMIZER', 'PLANNER', 'PROFILER'
+    ]
 
     @staticmethod
     def _create_config_file() -> None:
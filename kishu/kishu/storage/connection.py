@@ -0,0 +1,48 @@
+import contextlib
+import sqlite3
+import threading
+
+from typing import Generator, Optional
+
+
+class CachedConnection:
+    """
+    Opens one SQLite connection to a database per thread on first use and reuses it afterwards.
+
+    Connections are in autocommit mode with write-ahead logging, so single statements need no
+    explicit commit and readers never block on a writer. Multi-statement writes go through
+    transaction() to be committed (and synced) once.
+    """
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.database_path, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA temp_store=MEMORY")
+            con.execute("PRAGMA cache_size=-8000")
+            self._local.con = con
+        return con
+
+    @contextlib.contextmanager
+    def transaction(self, con: Optional[sqlite3.Connection] = None) -> Generator[sqlite3.Cursor, None, None]:
+        """
+        Yields a cursor whose statements are committed together on exit and rolled back on error.
+
+        @param con  If given, runs on this connection within the caller's transaction instead.
+        """
+        if con is not None:
+            yield con.cursor()
+            return
+        cur = self.get().cursor()
+        cur.execute("BEGIN")
+        try:
+            yield cur
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("COMMIT")
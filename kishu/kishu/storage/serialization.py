@@ -0,0 +1,108 @@
+"""
+Object serialization for checkpoints and commit entries.
+
+Uses the C-accelerated stdlib pickler and falls back to dill only for objects that stdlib pickle
+cannot handle correctly: functions and classes defined in the notebook (which stdlib pickle would
+store by reference) and anything that fails to pickle altogether. Data is prefixed with a one-byte
+tag naming the serializer, so loading only goes through dill when dumping did. Serialized data may
+additionally be zlib-compressed, marked by its own tag.
+"""
+import dill
+import io
+import pickle
+import struct
+import types
+import zlib
+
+from typing import Any, Callable, List
+
+
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Prefix of blobs holding a pickle stream followed by its out-of-band buffers. Pickle streams of
+# protocol 2+ start with the PROTO opcode (0x80), so the two never collide.
+OUT_OF_BAND_MAGIC = b"KISHUOOB"
+
+PICKLE_TAG = b"P"
+DILL_TAG = b"D"
+COMPRESSED_TAG = b"Z"
+
+
+class KishuPickler(pickle.Pickler):
+    def reducer_override(self, obj: Any) -> Any:
+        # Notebook-defined functions and classes must be stored by value.
+        if isinstance(obj, (types.FunctionType, type)) and getattr(obj, "__module__", None) == "__main__":
+            return dill.loads, (dill.dumps(obj),)
+        return NotImplemented
+
+
+def dumps(obj: Any) -> bytes:
+    try:
+        buffer = io.BytesIO()
+        buffer.write(PICKLE_TAG)
+        KishuPickler(buffer, protocol=PICKLE_PROTOCOL).dump(obj)
+        return buffer.getvalue()
+    except Exception:
+        return DILL_TAG + dill.dumps(obj)
+
+
+def loads(data: bytes) -> Any:
+    tag = data[:1]
+    if tag == PICKLE_TAG:
+        return pickle.loads(memoryview(data)[1:])
+    if tag == DILL_TAG:
+        return dill.loads(memoryview(data)[1:])
+    if tag == COMPRESSED_TAG:
+        return loads(zlib.decompress(memoryview(data)[1:]))
+    # Untagged data was written by dill before tags were introduced.
+    return dill.loads(data)
+
+
+def compress(data: bytes, level: int) -> bytes:
+    """
+    Compresses data returned by dumps with zlib. Data that does not shrink, e.g., base64-encoded
+    images, is returned as is.
+
+    @param level  The zlib compression level; 0 disables compression.
+    """
+    if level <= 0:
+        return data
+    compressed = COMPRESSED_TAG + zlib.compress(data, level)
+    return compressed if len(compressed) < len(data) else data
+
+
+def dumps_out_of_band(obj: Any, dumps: Callable[..., bytes]) -> bytes:
+    """
+    Pickles with protocol 5 so that large buffers (e.g., numpy arrays) are collected out of band
+    and appended to the blob as-is instead of being copied through the pickle stream.
+
+    @param dumps  A pickle-compatible dumps function, e.g., cloudpickle.dumps.
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    stream = dumps(obj, protocol=5, buffer_callback=buffers.append)
+    if not buffers:
+        return stream
+    raws = [buffer.raw() for buffer in buffers]
+    header = OUT_OF_BAND_MAGIC + struct.pack(f"<I{len(raws) + 1}Q", len(raws), len(stream), *map(len, raws))
+    return b"".join([header, stream, *raws])
+
+
+def loads_out_of_band(data: bytes, loads: Callable[..., Any]) -> Any:
+    """
+    Inverse of dumps_out_of_band. Blobs without out-of-band buffers are passed to loads unchanged.
+    """
+    if not data.startswith(OUT_OF_BAND_MAGIC):
+        return loads(data)
+
+    # Copy once into a writable buffer so restored arrays are not read-only.
+    view = memoryview(bytearray(data))
+    offset = len(OUT_OF_BAND_MAGIC)
+    (num_buffers,) = struct.unpack_from("<I", view, offset)
+    offset += 4
+    lengths = struct.unpack_from(f"<{num_buffers + 1}Q", view, offset)
+    offset += 8 * (num_buffers + 1)
+    chunks = []
+    for length in lengths:
+        chunks.append(view[offset:offset + length])
+        offset += length
+    return loads(chunks[0], buffers=chunks[1:])
@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from typing import Dict, List
 
 from kishu.exceptions import TagNotFoundError
+from kishu.storage.connection import CachedConnection
 from kishu.storage.path import KishuPath
 
 
@@ -23,23 +24,19 @@ class KishuTag:
 
     def __init__(self, notebook_id: str):
         self.database_path = KishuPath.database_path(notebook_id)
+        self._connection = CachedConnection(self.database_path)
 
     def init_database(self):
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         cur.execute(f'create table if not exists {TAG_TABLE} (tag_name text primary key, commit_id text, message text)')
-        con.commit()
 
     def upsert_tag(self, tag: TagRow) -> None:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         query = f"insert or replace into {TAG_TABLE} values (?, ?, ?)"
         cur.execute(query, (tag.tag_name, tag.commit_id, tag.message))
-        con.commit()
 
     def list_tag(self) -> List[TagRow]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         query = f"select tag_name, commit_id, message from {TAG_TABLE}"
         try:
             cur.execute(query)
@@ -50,12 +47,9 @@ class KishuTag:
         except sqlite3.OperationalError:
             # No such table means no tag
             return []
-        finally:
-            con.close()
 
     def tags_for_commit(self, commit_id: str) -> List[TagRow]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         query = f"select tag_name, commit_id, message from {TAG_TABLE} where commit_id = ?"
         try:
             cur.execute(query, (commit_id,))
@@ -66,12 +60,9 @@ class KishuTag:
         except sqlite3.OperationalError:
             # No such table means no tag
             return []
-        finally:
-            con.close()
 
     def tags_for_many_commits(self, commit_ids: List[str]) -> Dict[str, List[TagRow]]:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        cur = self._connection.get().cursor()
         query = "select tag_name, commit_id, message from {} where commit_id in ({})".format(
             TAG_TABLE,
             ', '.join('?' * len(commit_ids))
@@ -92,19 +83,14 @@ class KishuTag:
         except sqlite3.OperationalError:
             # No such table means no tag
             return {}
-        finally:
-            con.close()
 
     def delete_tag(self, tag_name: str) -> None:
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+        with self._connection.transaction() as cur:
+            if not KishuTag._contains_tag(cur, tag_name):
+                raise TagNotFoundError(tag_name)
 
-        if not KishuTag._contains_tag(cur, tag_name):
-            raise TagNotFoundError(tag_name)
-
-        query = f"delete from {TAG_TABLE} where tag_name = ?"
-        cur.execute(query, (tag_name,))
-        con.commit()
+            query = f"delete from {TAG_TABLE} where tag_name = ?"
+            cur.execute(query, (tag_name,))
 
     @staticmethod
     def _contains_tag(cur: sqlite3.Cursor, tag_name: str) -> bool:
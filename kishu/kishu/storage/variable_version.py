@@ -1,12 +1,17 @@
 import sqlite3
 
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
 from kishu.storage.path import KishuPath
 
 
 VARIABLE_VERSION_TABLE = 'variable_version'
 COMMIT_VARIABLE_VERSION_TABLE = 'commit_variable'
+COMMIT_VARIABLE_DELTA_TABLE = 'commit_variable_delta'
+COMMIT_VARIABLE_BASE_TABLE = 'commit_variable_base'
+
+# Maximum number of deltas between full snapshots of a commit's variable versions.
+SNAPSHOT_INTERVAL = 64
 
 
 class VariableVersion:
@@ -30,36 +35,107 @@ class VariableVersion:
         cur.execute(f'create index if not exists commit_id_index on '
                     f'{COMMIT_VARIABLE_VERSION_TABLE} (commit_id)')
 
+        # Commits stored as deltas record the changed variables (var_commit_id is null if deleted)
+        # and the commit they are relative to. Commits without a base are stored as full snapshots
+        # in the commit_variable table.
+        cur.execute(
+            f'create table if not exists {COMMIT_VARIABLE_DELTA_TABLE} '
+            f'(commit_id text, var_name text, var_commit_id text, primary key (commit_id, var_name))')
+        cur.execute(
+            f'create table if not exists {COMMIT_VARIABLE_BASE_TABLE} '
+            f'(commit_id text primary key, base_commit_id text, depth int)')
+
         con.commit()
 
-    def store_variable_version_table(self, var_names: Set[str], commit_id: str):
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+    def store_variable_version_table(self, var_names: Set[str], commit_id: str,
+                                     con: Optional[sqlite3.Connection] = None):
+        cur = (con or sqlite3.connect(self.database_path)).cursor()
         for var_name in var_names:
             cur.execute(
                 f"insert into {VARIABLE_VERSION_TABLE} values (?, ?)",
                 (var_name, commit_id)
             )
-        con.commit()
+        if con is None:
+            cur.connection.commit()
 
-    def store_commit_variable_version_table(self, commit_id: str, commit_variable_version_map: Dict[str, str]):
-        con = sqlite3.connect(self.database_path)
-        cur = con.cursor()
+    def store_commit_variable_version_table(self, commit_id: str, commit_variable_version_map: Dict[str, str],
+                                            con: Optional[sqlite3.Connection] = None):
+        cur = (con or sqlite3.connect(self.database_path)).cursor()
         values_to_insert = [(commit_id, key, value) for key, value in commit_variable_version_map.items()]
         cur.executemany(
             f"insert into {COMMIT_VARIABLE_VERSION_TABLE} values (?, ?, ?)",
             values_to_insert
         )
-        con.commit()
+        if con is None:
+            cur.connection.commit()
+
+    def store_commit_variable_version_delta(self, commit_id: str, base_commit_id: Optional[str],
+                                            commit_variable_version_map: Dict[str, str], changed_vars: Set[str],
+                                            deleted_vars: Set[str], con: Optional[sqlite3.Connection] = None):
+        """
+        Stores the variable versions of commit_id as the change from base_commit_id. A full snapshot
+        is stored instead if there is no base or the base is SNAPSHOT_INTERVAL deltas from a snapshot.
+
+        @param base_commit_id  The commit whose variable versions commit_variable_version_map was
+                derived from by deleting deleted_vars and then setting changed_vars to commit_id.
+        """
+        cur = (con or sqlite3.connect(self.database_path)).cursor()
+        depth = 0
+        if base_commit_id is not None:
+            cur.execute(f"select depth from {COMMIT_VARIABLE_BASE_TABLE} where commit_id = ?", (base_commit_id,))
+            res = cur.fetchone()
+            depth = 0 if res is None or res[0] + 1 >= SNAPSHOT_INTERVAL else res[0] + 1
+
+        if depth == 0:
+            cur.execute(f"insert into {COMMIT_VARIABLE_BASE_TABLE} values (?, ?, ?)", (commit_id, None, 0))
+            self.store_commit_variable_version_table(commit_id, commit_variable_version_map, con=cur.connection)
+        else:
+            cur.execute(f"insert into {COMMIT_VARIABLE_BASE_TABLE} values (?, ?, ?)",
+                        (commit_id, base_commit_id, depth))
+            delta = {var_name: None for var_name in deleted_vars}
+            delta.update({var_name: commit_id for var_name in changed_vars})
+            cur.executemany(
+                f"insert into {COMMIT_VARIABLE_DELTA_TABLE} values (?, ?, ?)",
+                [(commit_id, var_name, var_commit_id) for var_name, var_commit_id in delta.items()]
+            )
+        if con is None:
+            cur.connection.commit()
 
     def get_variable_version_by_commit_id(self, commit_id: str) -> Dict[str, str]:
         con = sqlite3.connect(self.database_path)
         cur = con.cursor()
+
+        # Walk back to the nearest full snapshot.
+        delta_commit_ids = []
+        snapshot_commit_id = commit_id
+        while True:
+            cur.execute(
+                f"select base_commit_id from {COMMIT_VARIABLE_BASE_TABLE} where commit_id = ?",
+                (snapshot_commit_id,)
+            )
+            res = cur.fetchone()
+            if res is None or res[0] is None:
+                break
+            delta_commit_ids.append(snapshot_commit_id)
+            snapshot_commit_id = res[0]
+
         cur.execute(
             f"select var_name, var_commit_id from {COMMIT_VARIABLE_VERSION_TABLE} where commit_id = ?",
-            (commit_id,)
+            (snapshot_commit_id,)
         )
         result = {var_name: var_commit_id for var_name, var_commit_id in cur}
+
+        # Replay deltas from oldest to newest.
+        for delta_commit_id in reversed(delta_commit_ids):
+            cur.execute(
+                f"select var_name, var_commit_id from {COMMIT_VARIABLE_DELTA_TABLE} where commit_id = ?",
+                (delta_commit_id,)
+            )
+            for var_name, var_commit_id in cur.fetchall():
+                if var_commit_id is None:
+                    result.pop(var_name, None)
+                else:
+                    result[var_name] = var_commit_id
         con.commit()
         return result
 
@@ -0,0 +1,147 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+/**
+ * Parser for the packed active variable snapshot format written by
+ * kishu.planning.ahg.AHG.serialize_active_vses:
+ *
+ *   "KVS1" | u32 count | count x ( i64 version | u16 num_names |
+ *                                  num_names x ( u16 len | utf-8 bytes ) )
+ *
+ * All integers are little endian.
+ **/
+
+static const char MAGIC[] = "KVS1";
+static const Py_ssize_t MAGIC_SIZE = 4;
+
+/**
+ * Reads a little-endian unsigned integer of `size` bytes at `*offset`,
+ * advancing the offset.
+ *
+ * @return 0 on success, -1 (with ValueError set) if the buffer is too short.
+ **/
+static int read_uint(const unsigned char *buf, Py_ssize_t buf_len,
+                     Py_ssize_t *offset, int size, uint64_t *out) {
+  if (*offset + size > buf_len) {
+    PyErr_SetString(PyExc_ValueError, "Truncated active variable snapshots.");
+    return -1;
+  }
+  uint64_t value = 0;
+  for (int i = size - 1; i >= 0; i--) {
+    value = (value << 8) | buf[*offset + i];
+  }
+  *offset += size;
+  *out = value;
+  return 0;
+}
+
+/**
+ * Builds the frozenset of variable names of one variable snapshot.
+ *
+ * @return New reference to the frozenset, or NULL on error.
+ **/
+static PyObject *parse_name(const unsigned char *buf, Py_ssize_t buf_len,
+                            Py_ssize_t *offset) {
+  uint64_t num_names;
+  if (read_uint(buf, buf_len, offset, 2, &num_names) < 0) {
+    return NULL;
+  }
+  PyObject *names = PyList_New((Py_ssize_t)num_names);
+  if (names == NULL) {
+    return NULL;
+  }
+  for (uint64_t i = 0; i < num_names; i++) {
+    uint64_t name_len;
+    if (read_uint(buf, buf_len, offset, 2, &name_len) < 0 ||
+        *offset + (Py_ssize_t)name_len > buf_len) {
+      if (!PyErr_Occurred()) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Truncated active variable snapshots.");
+      }
+      Py_DECREF(names);
+      return NULL;
+    }
+    PyObject *var_name = PyUnicode_DecodeUTF8((const char *)buf + *offset,
+                                              (Py_ssize_t)name_len, NULL);
+    if (var_name == NULL) {
+      Py_DECREF(names);
+      return NULL;
+    }
+    PyList_SET_ITEM(names, (Py_ssize_t)i, var_name);
+    *offset += (Py_ssize_t)name_len;
+  }
+  PyObject *name = PyFrozenSet_New(names);
+  Py_DECREF(names);
+  return name;
+}
+
+/**
+ * Parses packed active variable snapshots into a dict mapping each
+ * variable snapshot name (frozenset of str) to its version (int).
+ **/
+static PyObject *parse_active_vses(PyObject *self, PyObject *args) {
+  Py_buffer view;
+  if (!PyArg_ParseTuple(args, "y*", &view)) {
+    return NULL;
+  }
+  const unsigned char *buf = (const unsigned char *)view.buf;
+  Py_ssize_t buf_len = view.len;
+  Py_ssize_t offset = MAGIC_SIZE;
+  PyObject *result = NULL;
+  uint64_t count;
+
+  if (buf_len < MAGIC_SIZE || memcmp(buf, MAGIC, MAGIC_SIZE) != 0) {
+    PyErr_SetString(PyExc_ValueError, "Not packed active variable snapshots.");
+    goto done;
+  }
+  if (read_uint(buf, buf_len, &offset, 4, &count) < 0) {
+    goto done;
+  }
+  result = PyDict_New();
+  if (result == NULL) {
+    goto done;
+  }
+  for (uint64_t i = 0; i < count; i++) {
+    uint64_t raw_version;
+    if (read_uint(buf, buf_len, &offset, 8, &raw_version) < 0) {
+      goto fail;
+    }
+    PyObject *name = parse_name(buf, buf_len, &offset);
+    if (name == NULL) {
+      goto fail;
+    }
+    PyObject *version = PyLong_FromLongLong((long long)(int64_t)raw_version);
+    if (version == NULL) {
+      Py_DECREF(name);
+      goto fail;
+    }
+    int err = PyDict_SetItem(result, name, version);
+    Py_DECREF(name);
+    Py_DECREF(version);
+    if (err < 0) {
+      goto fail;
+    }
+  }
+  goto done;
+
+fail:
+  Py_CLEAR(result);
+done:
+  PyBuffer_Release(&view);
+  return result;
+}
+
+static PyMethodDef ActiveVsesMethods[] = {
+    {"parse_active_vses", parse_active_vses, METH_VARARGS,
+     "Parse packed active variable snapshots into a name -> version dict."},
+    {NULL, NULL, 0, NULL}};
+
+static struct PyModuleDef activevsesmodule = {
+    PyModuleDef_HEAD_INIT, "c_active_vses",
+    "C parser for packed active variable snapshots", -1, ActiveVsesMethods};
+
+PyMODINIT_FUNC PyInit_c_active_vses(void) {
+  return PyModule_Create(&activevsesmodule);
+}
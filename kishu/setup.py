@@ -30,8 +30,13 @@ visitor_module_extension = Extension(
     extra_compile_args=['-g', '-O0']
 )
 
+active_vses_extension = Extension(
+    "c_active_vses",
+    sources=["lib/active_vsesmodule.c"],
+)
+
 
 setup_args = dict(
-    ext_modules=[c_idgraph_extension, visitor_module_extension],
+    ext_modules=[c_idgraph_extension, visitor_module_extension, active_vses_extension],
 )
 setup(**setup_args)
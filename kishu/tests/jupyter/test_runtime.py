@@ -1,5 +1,6 @@
 import pytest
 import json
+import nbformat
 from unittest.mock import patch
 from pathlib import Path
 from kishu.jupyter.runtime import IPythonSession, JupyterRuntimeEnv
@@ -64,3 +65,14 @@ def test_enclosing_kernel_id_unexpected_format():
 def test_notebook_path_from_kernel_not_found():
     with pytest.raises(FileNotFoundError, match="Failed to identify notebook file path."):
         JupyterRuntimeEnv.notebook_path_from_kernel("non_existent_kernel_id")
+
+
+def test_notebook_json_round_trip(tmp_path):
+    nb_path = Path("tests/notebooks/test_jupyter_checkout.ipynb")
+    nb = JupyterRuntimeEnv.read_notebook_json(nb_path)
+    assert nb.metadata == JupyterRuntimeEnv.read_notebook(nb_path).metadata
+
+    # Writes the same layout as nbformat.
+    out_path = tmp_path / "out.ipynb"
+    JupyterRuntimeEnv.write_notebook_json(nb, out_path)
+    assert out_path.read_text() == nbformat.writes(JupyterRuntimeEnv.read_notebook(nb_path)) + "\n"
@@ -1,4 +1,6 @@
-from kishu.planning.ahg import AHG, VariableSnapshot
+import dill
+
+from kishu.planning.ahg import AHG, VariableSnapshot, VersionedName
 
 
 def test_add_cell_execution():
@@ -44,6 +46,50 @@ def test_update_graph():
     assert len(cell_executions[1].dst_vss) == 3
 
 
+def test_variable_snapshots_digest():
+    ahg = AHG()
+    assert ahg.get_variable_snapshots_digest() == 0
+
+    ahg.update_graph("", 1, 1, {}, {"x", "y"}, [], {}, {})
+    digest_1 = ahg.get_variable_snapshots_digest()
+    assert digest_1 != 0
+
+    # Reading without modifying creates no new variable snapshots.
+    ahg.update_graph("", 2, 1, {"x"}, {"x", "y"}, [], {}, {})
+    assert ahg.get_variable_snapshots_digest() == digest_1
+
+    # Modifying x creates a new variable snapshot.
+    ahg.update_graph("", 3, 1, {"x"}, {"x", "y"}, [], {"x"}, {})
+    assert ahg.get_variable_snapshots_digest() != digest_1
+
+
+def test_active_versions():
+    ahg = AHG()
+    assert ahg.get_active_versions() == {}
+
+    # x and y are created
+    ahg.update_graph("", 1, 1, {}, {"x", "y"}, [], {}, {})
+    assert ahg.get_active_versions() == {frozenset("x"): 1, frozenset("y"): 1}
+
+    # x is modified
+    ahg.update_graph("", 2, 1, {"x"}, {"x", "y"}, [], {"x"}, {})
+    assert ahg.get_active_versions() == {frozenset("x"): 2, frozenset("y"): 1}
+    assert AHG.deserialize_active_vses(ahg.serialize_active_vses()) == ahg.get_active_versions()
+
+
+def test_serialize_active_vses():
+    ahg = AHG()
+    ahg.update_graph("", 1, 1, {}, {"x", "y", "z"}, [("x", "y")], {}, {})
+    serialized = ahg.serialize_active_vses()
+    expected = {frozenset({"x", "y"}): 1, frozenset("z"): 1}
+    assert AHG.deserialize_active_vses(serialized) == expected
+    assert AHG._parse_active_vses(serialized.encode('latin1')) == expected
+
+    # Active variable snapshots stored by older versions.
+    legacy = dill.dumps([VersionedName(frozenset({"x", "y"}), 1), VersionedName(frozenset("z"), 1)]).decode('latin1')
+    assert AHG.deserialize_active_vses(legacy) == expected
+
+
 def test_update_graph_with_connected_components():
     """
         Connected components:
@@ -0,0 +1,43 @@
+import pytest
+
+from kishu.exceptions import BranchNotFoundError
+from kishu.storage.branch import BranchRow, HeadBranch, KishuBranch
+
+
+def test_head_follows_other_writers():
+    kishu_branch = KishuBranch("test_head_nb")
+    assert kishu_branch.get_head() == HeadBranch(branch_name=None, commit_id=None)
+
+    kishu_branch.update_head(branch_name="main", commit_id="1")
+    assert kishu_branch.get_head() == HeadBranch(branch_name="main", commit_id="1")
+
+    # Mutating a returned head does not affect the cached head.
+    kishu_branch.get_head().commit_id = "mutated"
+    assert kishu_branch.get_head().commit_id == "1"
+
+    # Heads written by another instance (e.g., another process) are picked up.
+    KishuBranch("test_head_nb").update_head(commit_id="2", is_detach=True)
+    assert kishu_branch.get_head() == HeadBranch(branch_name=None, commit_id="2")
+
+
+def test_branches_without_table():
+    kishu_branch = KishuBranch("test_no_branch_table_nb")
+    assert kishu_branch.list_branch() == []
+    assert kishu_branch.branches_for_many_commits(["1"]) == {}
+    with pytest.raises(BranchNotFoundError):
+        KishuBranch("test_no_branch_table_nb").delete_branch("main")
+
+
+def test_branches_for_many_commits():
+    kishu_branch = KishuBranch("test_many_branches_nb")
+    kishu_branch.init_database()
+    kishu_branch.upsert_branch("a", "1")
+    kishu_branch.upsert_branch("b", "1")
+    kishu_branch.upsert_branch("c", "1500")
+
+    commit_ids = [str(i) for i in range(2000)]
+    branch_by_commit = kishu_branch.branches_for_many_commits(commit_ids)
+    assert sorted(branch_by_commit) == ["1", "1500"]
+    assert sorted(branch.branch_name for branch in branch_by_commit["1"]) == ["a", "b"]
+    assert kishu_branch.branches_for_many_commits(["1500"]) == {"1500": [BranchRow("c", "1500")]}
+    assert kishu_branch.branches_for_many_commits(["2"]) == {}
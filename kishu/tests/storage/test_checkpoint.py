@@ -18,3 +18,13 @@ def test_create_table():
     # The namespace table should exist.
     cur.execute(f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{VARIABLE_SNAPSHOT_TABLE}';")
     assert cur.fetchone()[0] == 1
+
+
+def test_store_checkpoint_returns_bytes_written():
+    filename = KishuPath.database_path("test")
+    kishu_checkpoint = KishuCheckpoint(filename)
+    kishu_checkpoint.init_database()
+
+    data = b"checkpoint data"
+    assert kishu_checkpoint.store_checkpoint("test_store_checkpoint_returns_bytes_written", data) == len(data)
+    assert kishu_checkpoint.get_checkpoint("test_store_checkpoint_returns_bytes_written") == data
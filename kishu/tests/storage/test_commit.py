@@ -0,0 +1,120 @@
+import dill
+
+from kishu.storage.commit import COMMIT_ENTRY_TABLE, RAW_NB_TABLE, SESSION_STATE_TABLE, CommitEntry, KishuCommit
+
+
+def test_lazy_commit():
+    kishu_commit = KishuCommit("test_commit_nb")
+    kishu_commit.init_database()
+    kishu_commit.store_commit(CommitEntry(commit_id="1", message="msg", active_vses_string="vses"))
+
+    lazy_commit = kishu_commit.get_lazy_commit("1")
+    assert lazy_commit.active_vses_string == "vses"
+    assert "_entry" not in lazy_commit.__dict__
+
+    # Other fields decode the full commit entry once.
+    assert lazy_commit.message == "msg"
+    assert lazy_commit.raw_nb is None
+    assert lazy_commit.__dict__["message"] == "msg"
+
+
+def test_get_session_states():
+    kishu_commit = KishuCommit("test_session_states_nb")
+    kishu_commit.init_database()
+    kishu_commit.store_commit(CommitEntry(commit_id="1", active_vses_string="vses1"))
+    kishu_commit.store_commit(CommitEntry(commit_id="2", active_vses_string="vses2"))
+
+    assert kishu_commit.get_session_states(["1", "2", "3"]) == {"1": "vses1", "2": "vses2"}
+
+    # Session states pickled by older versions are still readable.
+    kishu_commit._connection.get().execute(
+        f"insert into {SESSION_STATE_TABLE} values (?, ?)", ("4", dill.dumps("vses4")))
+    kishu_commit.store_commit(CommitEntry(commit_id="5"))
+    assert kishu_commit.get_session_state("4") == "vses4"
+    assert kishu_commit.get_session_state("5") is None
+
+
+def test_keys_like():
+    kishu_commit = KishuCommit("test_keys_like_nb")
+    kishu_commit.init_database()
+    for commit_id in ["0:1", "0:10", "0:2", "1:1", "ab_c"]:
+        kishu_commit.store_commit(CommitEntry(commit_id=commit_id))
+
+    assert sorted(kishu_commit.keys_like("0:1")) == ["0:1", "0:10"]
+    assert sorted(kishu_commit.keys_like("0:")) == ["0:1", "0:10", "0:2"]
+    assert kishu_commit.keys_like("ab_") == ["ab_c"]
+    assert kishu_commit.keys_like("a_") == []
+    assert len(kishu_commit.keys_like("")) == 5
+
+
+def test_get_executed_cells():
+    kishu_commit = KishuCommit("test_executed_cells_nb")
+    kishu_commit.init_database()
+    kishu_commit.store_commit(CommitEntry(
+        commit_id="1", executed_cells=["", "a"], executed_cells_start=0, executed_cells_end=2))
+    kishu_commit.store_commit(CommitEntry(
+        commit_id="2", executed_cells=["b", "c"], executed_cells_start=2, executed_cells_end=4,
+        executed_cells_base="1"))
+    kishu_commit.store_commit(CommitEntry(commit_id="3", executed_cells=["", "legacy"]))
+
+    assert kishu_commit.get_executed_cells(kishu_commit.get_commit("2")) == ["", "a", "b", "c"]
+    assert kishu_commit.get_executed_cells(kishu_commit.get_commit("3")) == ["", "legacy"]
+    assert kishu_commit.get_executed_cells(CommitEntry(commit_id="4")) is None
+
+
+def test_commit_entry_cache():
+    kishu_commit = KishuCommit("test_entry_cache_nb")
+    kishu_commit.init_database()
+    kishu_commit.store_commit(CommitEntry(commit_id="1", message="msg"))
+
+    commit_entry = kishu_commit.get_commit("1")
+    assert kishu_commit.get_commit("1") == commit_entry
+
+    # Returned entries are copies, so changing one leaves the cached entry intact.
+    for returned_entry in [commit_entry, kishu_commit.get_commit("1"), kishu_commit.get_commits(["1"])["1"]]:
+        returned_entry.message = "unsaved"
+        assert kishu_commit.get_commit("1").message == "msg"
+
+    # Updated commits are read again from the database.
+    kishu_commit.update_commit(CommitEntry(commit_id="1", message="edited"))
+    assert kishu_commit.get_commit("1").message == "edited"
+
+    # So are commits updated through another connection, e.g., by another process.
+    KishuCommit("test_entry_cache_nb").update_commit(CommitEntry(commit_id="1", message="edited again"))
+    assert kishu_commit.get_commit("1").message == "edited again"
+
+
+def test_get_commits_mixes_cached_and_stored():
+    kishu_commit = KishuCommit("test_get_commits_nb")
+    kishu_commit.init_database()
+    for commit_id in ["1", "2", "3"]:
+        kishu_commit.store_commit(CommitEntry(commit_id=commit_id, message=commit_id))
+
+    cached_entry = kishu_commit.get_commit("1")
+
+    # Cached entries are not read again, even if their row is gone.
+    kishu_commit._connection.get().execute(f"delete from {COMMIT_ENTRY_TABLE} where commit_id = ?", ("1", ))
+    commit_entries = kishu_commit.get_commits(["1", "2", "4"])
+    assert sorted(commit_entries) == ["1", "2"]
+    assert commit_entries["1"] == cached_entry
+    assert commit_entries["2"].message == "2"
+
+
+def test_raw_nb_deduplicated():
+    kishu_commit = KishuCommit("test_raw_nb_nb")
+    kishu_commit.init_database()
+    kishu_commit.store_commit(CommitEntry(commit_id="1", raw_nb="nb1"))
+    kishu_commit.store_commit(CommitEntry(commit_id="2", raw_nb="nb1"))
+    kishu_commit.store_commit(CommitEntry(commit_id="3", raw_nb="nb2"))
+
+    cur = kishu_commit._connection.get().cursor()
+    assert cur.execute(f"select count(*) from {RAW_NB_TABLE}").fetchone() == (2,)
+
+    reader = KishuCommit("test_raw_nb_nb")
+    assert reader.get_commit("1").raw_nb == "nb1"
+    assert {key: entry.raw_nb for key, entry in reader.get_commits(["2", "3"]).items()} == {"2": "nb1", "3": "nb2"}
+
+    commit_entry = reader.get_commit("3")
+    commit_entry.raw_nb = "nb3"
+    reader.update_commit(commit_entry)
+    assert KishuCommit("test_raw_nb_nb").get_commit("3").raw_nb == "nb3"
@@ -1,14 +1,32 @@
+import json
+import pickle
 import pytest
 
 from kishu.storage.commit_graph import (
     NODE_SIZE,
     UNSET_POSITION,
     CommitNodeInfo,
+    CommitIdIndex,
     CommitNode,
     KishuCommitGraph,
 )
 
 
+NUM_PREBUILT_STEPS = 10000
+
+
+@pytest.fixture(scope="module")
+def prebuilt_graph(tmp_path_factory):
+    """
+    A linear on-file graph of NUM_PREBUILT_STEPS commits, built once for list_history queries.
+    Tests must not modify it.
+    """
+    graph = KishuCommitGraph.new_on_file(str(tmp_path_factory.mktemp("commit_graph")))
+    for idx in range(NUM_PREBUILT_STEPS):
+        graph.step(str(idx))
+    return graph
+
+
 class TestCommitNode:
 
     @pytest.mark.parametrize(
@@ -52,12 +70,58 @@ class TestCommitNode:
         assert new_node.position() == position
         assert new_node.parent_position() == parent_position
 
-    def test_too_large(self):
+    def test_deserialize_pickled(self):
+        node = CommitNode(CommitNodeInfo("2", "1"))
+        node.set_position((0, 1))
+        node_bytes = pickle.dumps(node)
+        node_bytes = len(node_bytes).to_bytes(1, "little") + node_bytes
+        node_bytes += bytes(NODE_SIZE - len(node_bytes))
+
+        new_node = CommitNode.deserialize(node_bytes)
+        assert new_node.info() == CommitNodeInfo("2", "1")
+        assert new_node.position() == (0, 1)
+        assert new_node.parent_position() == UNSET_POSITION
+
+    def test_too_large(self, tmp_path):
         large_id = "large_commit_" * NODE_SIZE
         node = CommitNode(CommitNodeInfo(large_id, ""))
         with pytest.raises(ValueError, match=r"CommitNode .* is too large (.* > .*)"):
             node.serialize()  # Expect fail
 
+        # Rejected when stepping, leaving the graph usable.
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        graph.step("1")
+        with pytest.raises(ValueError, match=r"CommitNode .* is too large (.* > .*)"):
+            graph.step(large_id)
+        graph.step("2")
+        graph.flush()
+        assert graph.head() == "2"
+        assert KishuCommitGraph.new_on_file(str(tmp_path)).list_history() == [
+            CommitNodeInfo("2", "1"),
+            CommitNodeInfo("1", ""),
+        ]
+
+
+class TestCommitNodeInfo:
+
+    def test_hash(self):
+        infos = {CommitNodeInfo("2", "1"), CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")}
+        assert infos == {CommitNodeInfo("1", ""), CommitNodeInfo("2", "1")}
+
+
+class TestCommitIdIndex:
+
+    def test_set_and_get(self):
+        index = CommitIdIndex(capacity=4)
+        for idx in range(100):
+            index.set(str(idx), (idx % 3 - 1, idx))
+        index.set("7", (5, 123))
+
+        assert index.get("7") == (5, 123)
+        assert index.get("8") == (1, 8)
+        assert index.get("99") == (-1, 99)
+        assert index.get("100") is None
+
 
 class TestKishuCommitGraph:
 
@@ -244,10 +308,131 @@ class TestKishuCommitGraph:
         for idx in range(NUM_STEP):
             graph.step(str(idx))
 
+        assert graph.history_depth(str(NUM_STEP - 1)) == NUM_STEP
         assert len(graph.list_history(str(NUM_STEP - 1))) == NUM_STEP
 
         # Test persistence for file-based store.
         if mode == "on_file":
             del graph
             graph = KishuCommitGraph.new_on_file(str(tmp_path))
+            assert graph.history_depth(str(NUM_STEP - 1)) == NUM_STEP
             assert len(graph.list_history(str(NUM_STEP - 1))) == NUM_STEP
+
+    def test_history_cache_follows_head(self, tmp_path):
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        graph.step("1")
+        graph.step("2")
+        history = graph.list_history()
+        history.clear()  # Returned lists are copies.
+        assert graph.list_history() == [CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+
+        graph.jump("1")
+        assert graph.list_history() == [CommitNodeInfo("1", "")]
+        graph.step("3")
+        assert graph.list_history() == [CommitNodeInfo("3", "1"), CommitNodeInfo("1", "")]
+        assert graph.list_history("2") == [CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+
+    def test_history_reuses_known_ancestors(self, tmp_path):
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        graph.step("1")
+        graph.step("2")
+        graph.step("3")
+        assert graph.list_history() == [CommitNodeInfo("3", "2"), CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+
+        graph.jump("2")
+        graph.step("4")
+        assert graph.list_history() == [CommitNodeInfo("4", "2"), CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+        assert graph.list_history("3") == [CommitNodeInfo("3", "2"), CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+        assert graph.list_history("1") == [CommitNodeInfo("1", "")]
+        assert graph.list_history("missing") == []
+
+    def test_buffered_steps_visible_after_flush(self, tmp_path):
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        graph.step("1")
+        graph.step("2")
+        assert graph.list_history() == [CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+        assert KishuCommitGraph.new_on_file(str(tmp_path)).list_history("2") == []
+
+        graph.flush()
+        other_graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        assert other_graph.head() == "2"
+        assert other_graph.list_history() == [CommitNodeInfo("2", "1"), CommitNodeInfo("1", "")]
+
+    def test_step_to_existing_commit_in_memory(self):
+        graph = KishuCommitGraph.new_in_memory()
+        graph.step("1")
+        graph.step("2")
+        graph.step("1")
+        assert graph.list_history() == [
+            CommitNodeInfo("1", "2"),
+            CommitNodeInfo("2", "1"),
+            CommitNodeInfo("1", ""),
+        ]
+
+    def test_jump_after_merges(self, tmp_path):
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        for idx in range(1000):
+            graph.step(str(idx))
+        graph.jump("500")
+        graph.step("500_1")
+        assert graph.list_history()[:3] == [
+            CommitNodeInfo("500_1", "500"),
+            CommitNodeInfo("500", "499"),
+            CommitNodeInfo("499", "498"),
+        ]
+        assert len(graph.list_history()) == 502
+
+    @pytest.mark.parametrize("commit_id", ["0", "1", "5000", str(NUM_PREBUILT_STEPS - 1)])
+    def test_list_history_prebuilt(self, prebuilt_graph, commit_id):
+        history = prebuilt_graph.list_history(commit_id)
+        assert len(history) == int(commit_id) + 1
+        assert history[0].commit_id == commit_id
+        assert history[-1] == CommitNodeInfo("0", "")
+
+    def test_jump_after_reload(self, tmp_path):
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        graph.step("1")
+        graph.step("2")
+        graph.flush()
+
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        graph.jump("1")
+        graph.jump("A")
+        assert graph.list_history() == [CommitNodeInfo("A", "")]
+        assert sorted(info.commit_id for info in graph.list_all_history()) == ["1", "2", "A"]
+
+    def test_head_from_legacy_file(self, tmp_path):
+        with open(tmp_path / "head.json", "w") as f:
+            json.dump({"commit_id": "1"}, f)
+        graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        assert graph.head() == "1"
+
+        graph.step("2")
+        graph.flush()
+        assert KishuCommitGraph.new_on_file(str(tmp_path)).head() == "2"
+
+    @pytest.mark.parametrize(
+        "mode",
+        [
+            "in_memory",
+            "on_file",
+        ],
+    )
+    def test_history_depth(self, tmp_path, mode):
+        if mode == "in_memory":
+            graph = KishuCommitGraph.new_in_memory()
+        elif mode == "on_file":
+            graph = KishuCommitGraph.new_on_file(str(tmp_path))
+        else:
+            raise ValueError(f"Invalid mode= {mode}")
+
+        assert graph.history_depth() == 0
+        graph.step("1")
+        graph.step("2")
+        graph.step("3")
+        graph.jump("1")
+        graph.step("1_1")
+        assert graph.history_depth() == 2
+        assert graph.history_depth("3") == 3
+        assert graph.history_depth("1") == 1
+        assert graph.history_depth("missing") == 0
@@ -0,0 +1,20 @@
+import pytest
+
+from kishu.storage.connection import CachedConnection
+from kishu.storage.path import KishuPath
+
+
+def test_transaction_rolls_back_on_error():
+    connection = CachedConnection(KishuPath.database_path("test_connection_nb"))
+    connection.get().execute("create table t (x integer)")
+
+    with connection.transaction() as cur:
+        cur.execute("insert into t values (1)")
+        cur.execute("insert into t values (2)")
+    with pytest.raises(ValueError):
+        with connection.transaction() as cur:
+            cur.execute("insert into t values (3)")
+            raise ValueError()
+
+    assert connection.get() is connection.get()
+    assert connection.get().execute("select x from t order by x").fetchall() == [(1,), (2,)]
@@ -0,0 +1,70 @@
+import cloudpickle
+import dill
+import os
+import numpy as np
+
+from kishu.storage import serialization
+
+
+def test_dumps_loads():
+    obj = {"a": [1, 2, 3], "b": "text", "c": np.arange(10)}
+    result = serialization.loads(serialization.dumps(obj))
+    assert result["a"] == obj["a"]
+    assert result["b"] == obj["b"]
+    assert np.array_equal(result["c"], obj["c"])
+
+
+def test_tagged_serializer():
+    assert serialization.dumps({"a": 1})[:1] == serialization.PICKLE_TAG
+    assert serialization.dumps(lambda: 1)[:1] == serialization.DILL_TAG
+
+    # Untagged data from older versions is loaded with dill.
+    assert serialization.loads(dill.dumps({"a": 1})) == {"a": 1}
+
+
+def test_compress():
+    data = serialization.dumps({"a": "text" * 1000})
+    compressed = serialization.compress(data, 1)
+    assert compressed[:1] == serialization.COMPRESSED_TAG
+    assert len(compressed) < len(data)
+    assert serialization.loads(compressed) == {"a": "text" * 1000}
+
+    # Incompressible data and level 0 are kept as is.
+    data = serialization.dumps(os.urandom(1000))
+    assert serialization.compress(data, 1) == data
+    assert serialization.compress(serialization.dumps("text" * 1000), 0)[:1] == serialization.PICKLE_TAG
+
+
+def test_notebook_function_stored_by_value():
+    notebook_globals = {"__name__": "__main__"}
+    exec("def f():\n    return 1", notebook_globals)
+    data = serialization.dumps(notebook_globals["f"])
+
+    # Redefining the function in the notebook does not change the stored one.
+    exec("def f():\n    return 2", notebook_globals)
+    assert serialization.loads(data)() == 1
+
+
+def test_fallback_for_unpicklable_objects():
+    value = 3
+    closure = lambda: value  # noqa: E731
+    assert serialization.loads(serialization.dumps(closure))() == 3
+
+
+def test_out_of_band_buffers():
+    obj = {"a": np.arange(12.0).reshape(3, 4), "b": "text"}
+    data = serialization.dumps_out_of_band(obj, cloudpickle.dumps)
+    assert data.startswith(serialization.OUT_OF_BAND_MAGIC)
+
+    result = serialization.loads_out_of_band(data, cloudpickle.loads)
+    assert np.array_equal(result["a"], obj["a"])
+    assert result["b"] == obj["b"]
+
+    # Restored arrays stay writable.
+    result["a"][0, 0] = 1.0
+
+
+def test_out_of_band_without_buffers():
+    data = serialization.dumps_out_of_band({"a": 1}, cloudpickle.dumps)
+    assert not data.startswith(serialization.OUT_OF_BAND_MAGIC)
+    assert serialization.loads_out_of_band(data, cloudpickle.loads) == {"a": 1}
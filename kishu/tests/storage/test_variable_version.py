@@ -1,4 +1,7 @@
-from kishu.storage.variable_version import VariableVersion
+import sqlite3
+
+from kishu.planning.variable_version_tracker import VariableVersionTracker
+from kishu.storage.variable_version import SNAPSHOT_INTERVAL, VariableVersion
 
 
 def test_variable_version_table():
@@ -22,3 +25,39 @@ def test_commit_variable_version_table():
     assert kishu_var_version.get_variable_version_by_commit_id("2") == {"b": "1", "a": "2", "c": "2"}
     assert kishu_var_version.get_variable_version_by_commit_id("3") == {"a": "2", "b": "3", "c": "3"}
     assert kishu_var_version.get_variable_version_by_commit_id("4") == {}
+
+
+def test_store_within_transaction():
+    kishu_var_version = VariableVersion("test_var_ver_nb")
+    kishu_var_version.init_database()
+
+    con = sqlite3.connect(kishu_var_version.database_path)
+    kishu_var_version.store_variable_version_table({"a"}, "1", con=con)
+    kishu_var_version.store_commit_variable_version_table("1", {"a": "1"}, con=con)
+
+    # Writes are not visible to other connections until the caller commits.
+    assert kishu_var_version.get_commit_ids_by_variable_name("a") == []
+    con.commit()
+    assert kishu_var_version.get_commit_ids_by_variable_name("a") == ["1"]
+    assert kishu_var_version.get_variable_version_by_commit_id("1") == {"a": "1"}
+
+
+def test_commit_variable_version_delta():
+    kishu_var_version = VariableVersion("test_var_ver_delta_nb")
+    kishu_var_version.init_database()
+    tracker = VariableVersionTracker({})
+    expected = {}
+    base_commit_id = None
+    for i in range(SNAPSHOT_INTERVAL + 10):
+        commit_id = str(i)
+        changed_vars = {f"x{i}", "y"}
+        deleted_vars = {f"x{i - 2}"} if i >= 2 else set()
+        tracker.update_variable_version(commit_id, changed_vars, deleted_vars)
+        kishu_var_version.store_commit_variable_version_delta(
+            commit_id, base_commit_id, tracker.get_variable_versions(), changed_vars, deleted_vars)
+        expected[commit_id] = dict(tracker.get_variable_versions())
+        base_commit_id = commit_id
+
+    for commit_id, variable_versions in expected.items():
+        assert kishu_var_version.get_variable_version_by_commit_id(commit_id) == variable_versions
+    assert kishu_var_version.get_variable_version_by_commit_id("unknown") == {}
@@ -1,8 +1,10 @@
 import pytest
+import shutil
 
 from pathlib import Path
 
 from kishu.exceptions import MissingNotebookMetadataError, NotNotebookPathOrKey
+from kishu.jupyter.runtime import JupyterRuntimeEnv
 from kishu.notebook_id import NotebookId
 
 
@@ -29,3 +31,17 @@ class TestNotebookId:
     def test_parse_key_neither(self):
         with pytest.raises(NotNotebookPathOrKey):
             _ = NotebookId.parse_key_from_path_or_key("non_existent_notebook.ipynb")
+
+    def test_attach_detach_kishu_metadata(self, tmp_path):
+        nb_path = tmp_path / "notebook.ipynb"
+        shutil.copy("tests/notebooks/simple_with_kishu.ipynb", nb_path)
+        notebook_id = NotebookId(key="simple_kishu_notebook_key", path=nb_path, kernel_id="test_kernel_id")
+
+        metadata = notebook_id.attach_kishu_metadata()
+        assert metadata.session_count == NotebookId.read_kishu_metadata(
+            JupyterRuntimeEnv.read_notebook(nb_path)).session_count
+
+        notebook_id.detach_kishu_metadata()
+        assert not NotebookId.verify_metadata_exists(nb_path)
+        with pytest.raises(MissingNotebookMetadataError):
+            notebook_id.detach_kishu_metadata()